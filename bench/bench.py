@@ -0,0 +1,216 @@
+"""Замеры всех этапов на синтетических корпусах.
+
+    python bench.py run --sizes 1000 10000 100000 --out results/my.json
+    python bench.py compare results/old.json results/new.json
+
+Для каждого размера корпус генерируется заново из seed в копию проекта
+(только .py-файлы task1-task5), и этапы запускаются по очереди, каждый
+в своём процессе (см. stages.py). Кэши текста и лемм перед каждым этапом
+удаляются, то есть замеряется холодный запуск этапа. Краулер замеряется
+отдельно, на локальном HTTP-сервере с тем же генератором страниц.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+sys.path.append(os.path.join(PROJECT_ROOT, 'task1'))
+
+from corpus import Corpus, CorpusServer
+
+TASK_DIRS = ('task1', 'task2', 'task3', 'task4', 'task5')
+# Данные, которые в копию проекта не переносятся
+DATA_DIRS = {'выкачка', '__pycache__', 'tokens', 'lemmas', 'tfidf_tokens', 'tfidf_lemmas', 'text_cache',
+             'segments', 'templates'}
+CACHE_PATHS = (os.path.join('task2', 'text_cache'), os.path.join('task2', 'lemma_cache.txt'))
+CORPUS_BASE_URL = 'https://bench.local/dog/'
+STAGES = ('process_documents', 'build_inverted_index', 'calculate_tf_idf', 'boolean_search', 'vector_search')
+METRICS = ('seconds', 'load_seconds', 'p50_ms', 'p95_ms', 'p99_ms', 'qps', 'pages_per_sec', 'peak_rss_mb')
+
+
+def git_info():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=PROJECT_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(status) if status is not None else None}
+
+
+def ignore_data(folder, names):
+    ignored = []
+    for name in names:
+        if os.path.isdir(os.path.join(folder, name)):
+            if name in DATA_DIRS:
+                ignored.append(name)
+        elif not name.endswith('.py'):
+            ignored.append(name)
+    return ignored
+
+
+def make_workspace(parent, name):
+    """Копия кода проекта без данных"""
+    root = os.path.join(parent, name)
+    for task_dir in TASK_DIRS:
+        shutil.copytree(os.path.join(PROJECT_ROOT, task_dir), os.path.join(root, task_dir), ignore=ignore_data)
+    return root
+
+
+def clear_caches(root):
+    for path in CACHE_PATHS:
+        path = os.path.join(root, path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def run_stage(stage, root, verbose=False, **options):
+    result_file = os.path.join(root, f'{stage}.result.json')
+    command = [sys.executable, os.path.join(BENCH_DIR, 'stages.py'), stage, '--root', root, '--result', result_file]
+    for name, value in options.items():
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    subprocess.run(command, check=True, stdout=None if verbose else subprocess.DEVNULL)
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def describe(stage, result):
+    parts = [f"{result[metric]:.4g} {metric}" for metric in METRICS if metric in result]
+    print(f"  {stage}: " + ", ".join(parts))
+
+
+def bench_crawl(workdir, args):
+    root = make_workspace(workdir, 'crawl')
+    with CorpusServer(Corpus(args.crawl_pages, seed=args.seed, doc_words=args.doc_words)) as server:
+        result = run_stage('crawl', root, args.verbose, base_url=server.base_url, max_pages=args.crawl_pages,
+                           workers=args.crawl_workers, page_format=args.page_format)
+    describe('crawl', result)
+    return result
+
+
+def bench_size(workdir, size, args):
+    root = make_workspace(workdir, f'corpus_{size}')
+    corpus = Corpus(size, seed=args.seed, doc_words=args.doc_words)
+    start = time.perf_counter()
+    corpus.write(os.path.join(root, 'task1', 'выкачка'), os.path.join(root, 'task1', 'index.txt'),
+                 CORPUS_BASE_URL, args.page_format)
+    results = {'corpus': {'docs': size, 'stems': len(corpus.stems), 'generate_seconds': time.perf_counter() - start}}
+
+    queries_file = os.path.join(root, 'queries.json')
+    with open(queries_file, 'w', encoding='utf-8') as f:
+        json.dump({'vector': corpus.queries(args.queries), 'boolean': corpus.boolean_queries(args.queries)},
+                  f, ensure_ascii=False)
+
+    for stage in args.stages:
+        clear_caches(root)
+        results[stage] = run_stage(stage, root, args.verbose, queries=queries_file, workers=args.workers)
+        describe(stage, results[stage])
+    return results
+
+
+def run(args):
+    meta = dict(git_info(), created=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                platform=platform.platform(), cpu_count=os.cpu_count(),
+                options={name: value for name, value in vars(args).items() if name not in ('command', 'out')})
+    report = {'meta': meta, 'sizes': {}}
+
+    workdir = tempfile.mkdtemp(prefix='bench-', dir=args.workdir)
+    try:
+        if args.crawl_pages > 0:
+            print(f"Краулер, {args.crawl_pages} страниц")
+            report['crawl'] = bench_crawl(workdir, args)
+        for size in args.sizes:
+            print(f"Корпус {size} документов")
+            report['sizes'][str(size)] = bench_size(workdir, size, args)
+    finally:
+        if args.keep:
+            print(f"Рабочие копии оставлены в {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = (meta['commit'] or 'nogit')[:10] + ('-dirty' if meta['dirty'] else '')
+        out = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в файл: {out}")
+
+
+def flatten(report):
+    """{(раздел, этап, метрика): значение}"""
+    values = {}
+    for metric, value in report.get('crawl', {}).items():
+        values[('crawl', 'crawl', metric)] = value
+    for size, stages in report.get('sizes', {}).items():
+        for stage, metrics in stages.items():
+            for metric, value in metrics.items():
+                values[(size, stage, metric)] = value
+    return values
+
+
+def compare(args):
+    with open(args.old, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"было: {old['meta'].get('commit')}  стало: {new['meta'].get('commit')}")
+
+    old_values, new_values = flatten(old), flatten(new)
+    print(f"{'корпус':>8} {'этап':<22} {'метрика':<14} {'было':>12} {'стало':>12} {'изменение':>10}")
+    order = lambda key: (int(key[0]) if key[0].isdigit() else -1, key[1], key[2])
+    for key in sorted(old_values.keys() & new_values.keys(), key=order):
+        if key[2] not in METRICS:
+            continue
+        before, after = old_values[key], new_values[key]
+        change = f"{after / before:.2f}x" if before else '-'
+        print(f"{key[0]:>8} {key[1]:<22} {key[2]:<14} {before:>12.4g} {after:>12.4g} {change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры краулера, предобработки, индексации и поиска")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="прогнать замеры и сохранить JSON")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                            help="размеры корпусов, документов (например 1000 10000 100000)")
+    run_parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    run_parser.add_argument('--queries', type=int, default=1000, help="запросов на каждый вид поиска")
+    run_parser.add_argument('--doc-words', type=int, default=400, help="средняя длина документа, слов")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--workers', type=int, default=1, help="процессов для process_documents")
+    run_parser.add_argument('--page-format', choices=('pretty', 'raw', 'gzip'), default='pretty')
+    run_parser.add_argument('--crawl-pages', type=int, default=1000, help="страниц для замера краулера, 0 - пропустить")
+    run_parser.add_argument('--crawl-workers', type=int, default=16)
+    run_parser.add_argument('--workdir', help="где создавать рабочие копии (по умолчанию во временной папке)")
+    run_parser.add_argument('--keep', action='store_true', help="не удалять рабочие копии")
+    run_parser.add_argument('--verbose', action='store_true', help="показывать вывод этапов")
+    run_parser.add_argument('--out', help="файл результатов (по умолчанию bench/results/<коммит>-<время>.json)")
+
+    compare_parser = commands.add_parser('compare', help="сравнить два файла результатов")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
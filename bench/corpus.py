@@ -0,0 +1,162 @@
+import os
+import re
+import threading
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Синтетические "русскоподобные" документы: основы из русских слогов с падежными
+# и глагольными окончаниями, частоты основ по закону Ципфа, плюс служебные слова.
+# Всё определяется seed, поэтому один и тот же корпус можно собрать на любом коммите.
+CONSONANTS = 'бвгджзклмнпрстфхцчшщ'
+VOWELS = 'аеиоуыяю'
+ENDINGS = ('', 'а', 'ы', 'у', 'е', 'ой', 'ом', 'ов', 'ам', 'ами', 'ах', 'и', 'ей',
+           'ый', 'ая', 'ое', 'ые', 'ого', 'ать', 'ет', 'ют', 'ал', 'ала', 'ный')
+FUNCTION_WORDS = ('и', 'в', 'не', 'на', 'что', 'с', 'по', 'как', 'это', 'для', 'у', 'от',
+                  'к', 'за', 'из', 'же', 'но', 'так', 'при', 'или')
+# Доля служебных слов среди вхождений - примерно как в живом тексте
+FUNCTION_SHARE = 0.3
+ZIPF_EXPONENT = 1.07
+SENTENCE_WORDS = 12
+DOC_RE = re.compile(r'^/dog/(?:(\d+)/)?$')
+
+
+class Corpus:
+    """n_docs документов по doc_words слов в среднем; документ i всегда один и тот же"""
+
+    def __init__(self, n_docs, seed=0, doc_words=400):
+        self.n_docs = n_docs
+        self.seed = seed
+        self.doc_words = doc_words
+
+        # Словарь растёт с корпусом примерно по закону Хипса
+        n_stems = int(min(200000, 8 * np.sqrt(n_docs * doc_words)))
+        rng = np.random.default_rng([seed, 0])
+        stems = {}
+        while len(stems) < n_stems:
+            n_syllables = int(rng.integers(2, 5))
+            stem = ''.join(CONSONANTS[c] + VOWELS[v] for c, v in zip(rng.integers(len(CONSONANTS), size=n_syllables),
+                                                                     rng.integers(len(VOWELS), size=n_syllables)))
+            stems.setdefault(stem[:-1], None)
+        self.stems = list(stems)
+        weights = 1.0 / np.arange(1, n_stems + 1) ** ZIPF_EXPONENT
+        self.cdf = np.cumsum(weights) / weights.sum()
+
+    def _rng(self, *key):
+        return np.random.default_rng([self.seed, *key])
+
+    def sample_words(self, rng, count):
+        stems = np.searchsorted(self.cdf, rng.random(count))
+        endings = rng.integers(len(ENDINGS), size=count)
+        return [self.stems[s] + ENDINGS[e] for s, e in zip(stems.tolist(), endings.tolist())]
+
+    def words(self, doc_id):
+        rng = self._rng(1, doc_id)
+        count = int(rng.poisson(self.doc_words)) + 20
+        words = self.sample_words(rng, count)
+        function = np.flatnonzero(rng.random(count) < FUNCTION_SHARE)
+        for i, j in zip(function.tolist(), rng.integers(len(FUNCTION_WORDS), size=len(function)).tolist()):
+            words[i] = FUNCTION_WORDS[j]
+        return words
+
+    def text(self, doc_id):
+        words = self.words(doc_id)
+        sentences = []
+        for start in range(0, len(words), SENTENCE_WORDS):
+            sentence = words[start:start + SENTENCE_WORDS]
+            sentences.append(' '.join([sentence[0].capitalize()] + sentence[1:]) + '.')
+        return sentences
+
+    def links(self, doc_id):
+        """Ссылки документа: следующие по номеру и "дети" в двоичном дереве - обход от 0 находит все"""
+        candidates = (doc_id + 1, doc_id + 2, 2 * doc_id + 1, 2 * doc_id + 2)
+        return sorted({link for link in candidates if link < self.n_docs})
+
+    def url(self, doc_id, base_url):
+        return base_url if doc_id == 0 else f"{base_url}{doc_id}/"
+
+    def html(self, doc_id, base_url='/dog/'):
+        sentences = self.text(doc_id)
+        paragraphs = [' '.join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+        links = ''.join(f'<li><a href="{self.url(link, base_url)}">Документ {link}</a></li>'
+                        for link in self.links(doc_id))
+        body = ''.join(f'<p>{escape(paragraph)}</p>\n' for paragraph in paragraphs)
+        return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Документ {doc_id}</title>'
+                f'<style>p {{ margin: 0 }}</style></head>\n<body>\n'
+                f'<nav><a href="{base_url}">Главная</a> Меню сайта</nav>\n'
+                f'<h1>Документ {doc_id}</h1>\n{body}<ul>{links}</ul>\n'
+                f'<footer>Подвал сайта, все права защищены</footer>\n'
+                f'<script>var page = {doc_id};</script>\n</body></html>\n').encode('utf-8')
+
+    def write(self, folder, index_file, base_url, page_format='pretty'):
+        """Сохраняет корпус так же, как его сохранил бы краулер task1"""
+        from pages import write_page
+
+        os.makedirs(folder, exist_ok=True)
+        with open(index_file, 'w', encoding='utf-8') as index_out:
+            for doc_id in range(self.n_docs):
+                write_page(folder, doc_id, self.html(doc_id, base_url), page_format)
+                index_out.write(f"{doc_id}: {self.url(doc_id, base_url)}\n")
+
+    def queries(self, n, seed=1):
+        """Запросы из 1-3 слов с частотами корпуса"""
+        rng = self._rng(2, seed)
+        sizes = rng.integers(1, 4, size=n).tolist()
+        words = self.sample_words(rng, sum(sizes))
+        queries, start = [], 0
+        for size in sizes:
+            queries.append(' '.join(words[start:start + size]))
+            start += size
+        return queries
+
+    def boolean_queries(self, n, seed=1):
+        """Булевы запросы вида a AND b, a OR b, a AND NOT b, (a OR b) AND c"""
+        rng = self._rng(3, seed)
+        patterns = ('{} AND {}', '{} OR {}', '{} AND NOT {}', '({} OR {}) AND {}')
+        choices = rng.integers(len(patterns), size=n).tolist()
+        words = self.sample_words(rng, 3 * n)
+        return [patterns[c].format(*words[3 * i:3 * i + 3]) for i, c in enumerate(choices)]
+
+
+class CorpusServer:
+    """Локальный HTTP-сервер с документами корпуса по адресам /dog/ и /dog/N/ - стенд для краулера"""
+
+    def __init__(self, corpus, host='127.0.0.1', port=0):
+        self.corpus = corpus
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                match = DOC_RE.match(self.path)
+                doc_id = int(match.group(1) or 0) if match else None
+                if doc_id is None or doc_id >= server.corpus.n_docs:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = server.corpus.html(doc_id, server.base_url)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_port}/dog/"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,164 @@
+"""Один этап замера в отдельном процессе: python stages.py <этап> --root <копия проекта> --result <json>.
+
+Модули берутся из копии проекта в --root, поэтому все их пути (выкачка, индекс,
+TF-IDF) указывают внутрь копии, а не на настоящие данные. Отдельный процесс
+на этап - это честный пик памяти этапа и никакого прогретого состояния от
+предыдущих этапов.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import importlib.util
+
+import numpy as np
+
+
+def peak_rss_mb():
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss в Linux - в килобайтах, в macOS - в байтах
+    return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+def latency_stats(latencies, total):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'queries': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'qps': len(latencies) / total if total > 0 else 0.0,
+    }
+
+
+def time_queries(search, queries, warmup=20):
+    """Задержка каждого запроса; первые warmup запросов прогоняются без замера"""
+    for query in queries[:warmup]:
+        search(query)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - query_start)
+    return latency_stats(latencies, time.perf_counter() - start)
+
+
+def import_path(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Модуль должен находиться по имени, иначе его функции не передать в процессы Pool
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def crawl(root, args):
+    sys.path.insert(0, os.path.join(root, 'task1'))
+    import crawler
+
+    folder = os.path.join(root, 'task1', 'crawl')
+    sys.argv = ['crawler.py', '--base-url', args.base_url, '--output', folder,
+                '--index-file', os.path.join(root, 'task1', 'crawl_index.txt'),
+                '--state', os.path.join(root, 'task1', 'crawl_state.sqlite'),
+                '--manifest', os.path.join(root, 'task1', 'crawl_changes.json'),
+                '--max-pages', str(args.max_pages), '--async', '--workers', str(args.workers),
+                '--rate', '100000', '--burst', '1000', '--format', args.page_format]
+    start = time.perf_counter()
+    crawler.main()
+    elapsed = time.perf_counter() - start
+    pages = len(os.listdir(folder))
+    return {'seconds': elapsed, 'pages': pages, 'pages_per_sec': pages / elapsed}
+
+
+def process_documents(root, args):
+    sys.path.insert(0, os.path.join(root, 'task2'))
+    module = import_path('token_lemm', os.path.join(root, 'task2', 'token&lemm.py'))
+    start = time.perf_counter()
+    module.process_documents(os.path.join(root, 'task1', 'выкачка'), os.path.join(root, 'task2', 'tokens'),
+                             os.path.join(root, 'task2', 'lemmas'), workers=args.workers)
+    return {'seconds': time.perf_counter() - start}
+
+
+def build_inverted_index(root, args):
+    sys.path.insert(0, os.path.join(root, 'task3'))
+    from build_index import build_inverted_index
+    from binary_index import write_binary_index
+
+    start = time.perf_counter()
+    index = build_inverted_index(os.path.join(root, 'task1', 'выкачка'), report_every=10 ** 9)
+    elapsed = time.perf_counter() - start
+    # Индекс нужен следующим этапам, его запись в замер не входит
+    write_binary_index(os.path.join(root, 'task3', 'inverted_index.bin'), index)
+    return {'seconds': elapsed, 'terms': len(index)}
+
+
+def calculate_tf_idf(root, args):
+    sys.path.insert(0, os.path.join(root, 'task4'))
+    from tfidf import calculate_tf_idf
+
+    start = time.perf_counter()
+    calculate_tf_idf()
+    return {'seconds': time.perf_counter() - start}
+
+
+def boolean_search(root, args):
+    sys.path.insert(0, os.path.join(root, 'task3'))
+    from binary_index import load_inverted_index
+    from inverted_list import boolean_search
+    from query_compiler import BooleanSearcher
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = json.load(f)['boolean']
+    start = time.perf_counter()
+    searcher = BooleanSearcher(load_inverted_index(os.path.join(root, 'task3', 'inverted_index.bin'),
+                                                   os.path.join(root, 'task3', 'inverted_index.json')))
+    load_seconds = time.perf_counter() - start
+    return dict(time_queries(lambda query: boolean_search(query, searcher), queries), load_seconds=load_seconds)
+
+
+def vector_search(root, args):
+    sys.path.insert(0, os.path.join(root, 'task5'))
+    from main import VectorSearchEngine
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = json.load(f)['vector']
+    start = time.perf_counter()
+    engine = VectorSearchEngine()
+    load_seconds = time.perf_counter() - start
+    return dict(time_queries(engine.search, queries), load_seconds=load_seconds)
+
+
+STAGES = {
+    'crawl': crawl,
+    'process_documents': process_documents,
+    'build_inverted_index': build_inverted_index,
+    'calculate_tf_idf': calculate_tf_idf,
+    'boolean_search': boolean_search,
+    'vector_search': vector_search,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Один этап замера (запускается из bench.py)")
+    parser.add_argument('stage', choices=list(STAGES))
+    parser.add_argument('--root', required=True, help="копия проекта с корпусом")
+    parser.add_argument('--result', required=True, help="куда записать результат (JSON)")
+    parser.add_argument('--queries', help="файл запросов (JSON)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--base-url')
+    parser.add_argument('--max-pages', type=int, default=1000)
+    parser.add_argument('--page-format', default='pretty')
+    args = parser.parse_args()
+
+    result = STAGES[args.stage](os.path.abspath(args.root), args)
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import os
+import asyncio
+from urllib.parse import urlparse
+
+import aiohttp
+
+from crawler import conditional_headers, handle_response
+
+
+class TokenBucket:
+    """Ограничение частоты запросов к одному хосту: rate запросов в секунду,
+    не больше burst подряд"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncCrawler:
+    """Асинхронный обход: пул воркеров поверх общей очереди ссылок.
+
+    Соединения переиспользуются через одну aiohttp-сессию (keep-alive),
+    вместо глобальной паузы у каждого хоста своё ведро токенов, поэтому
+    скорость упирается в настройки вежливости, а не в задержку сети.
+    Строки index.txt пишутся в один открытый файл. Очередь и скачанные
+    страницы сохраняются в CrawlState, как и в обычном режиме.
+    """
+
+    def __init__(self, base_url, output_folder, index_file, state, changes, max_pages=100,
+                 workers=8, rate=1.0, burst=1, timeout=30, page_format="pretty"):
+        self.base_url = base_url
+        self.output_folder = output_folder
+        self.index_file = index_file
+        self.state = state
+        self.changes = changes
+        self.max_pages = max_pages
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.page_format = page_format
+
+        self.seen_urls = set()
+        self.buckets = {}
+        self.reserved = 0  # сколько документов уже есть или скачивается
+
+    def bucket(self, url):
+        host = urlparse(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def enqueue(self, url):
+        # Дубликаты отсекаем сразу, чтобы очередь не разрасталась
+        if url not in self.seen_urls:
+            self.seen_urls.add(url)
+            self.state.push(url)
+            self.queue.put_nowait(url)
+
+    async def fetch(self, session, url, headers):
+        await self.bucket(url).acquire()
+        async with session.get(url, headers=headers) as response:
+            if response.status not in (304, 404, 410):
+                response.raise_for_status()
+            body = await response.read()
+            text = await response.text(errors='replace') if 200 <= response.status < 300 else ''
+            return response.status, response.headers, body, text
+
+    async def worker(self, session, index_out):
+        while True:
+            url = await self.queue.get()
+            reserved = False  # заняла ли новая страница место под max_pages
+            try:
+                page = self.state.page(url)
+                if page is None:
+                    # Новые страницы - только пока не набрали max_pages документов,
+                    # ссылка при этом остаётся в очереди состояния до следующего запуска
+                    if self.reserved >= self.max_pages:
+                        continue
+                    self.reserved += 1
+                    reserved = True
+                try:
+                    status, headers, body, text = await self.fetch(
+                        session, url, conditional_headers(page, self.output_folder))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"Ошибка при скачивании страницы {url}: {e}")
+                    links = []
+                else:
+                    links = handle_response(self.state, self.changes, url, status, headers, body, text,
+                                            self.output_folder, index_out, self.base_url,
+                                            page_format=self.page_format)
+                for link in links:
+                    self.enqueue(link)
+                # Место остаётся занятым, только если документ сохранён
+                if reserved and self.state.page(url) is not None:
+                    reserved = False
+                self.state.done(url)
+                self.state.commit()
+            except Exception as e:
+                # Ошибка на одной странице не должна останавливать воркер: когда упадут
+                # все воркеры, queue.join() в crawl() никогда не дождётся конца очереди
+                print(f"Ошибка при обработке страницы {url}: {type(e).__name__}: {e}")
+            finally:
+                if reserved:
+                    self.reserved -= 1
+                self.queue.task_done()
+
+    async def crawl(self):
+        self.queue = asyncio.Queue()
+        self.seen_urls = self.state.known_urls()
+        self.reserved = self.state.page_count()
+        for url in self.state.frontier():
+            self.queue.put_nowait(url)
+        os.makedirs(self.output_folder, exist_ok=True)
+
+        connector = aiohttp.TCPConnector(limit=self.workers)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            with open(self.index_file, "a", encoding="utf-8") as index_out:
+                tasks = [asyncio.create_task(self.worker(session, index_out)) for _ in range(self.workers)]
+                await self.queue.join()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        return asyncio.run(self.crawl())
@@ -0,0 +1,151 @@
+import os
+import json
+import sqlite3
+from collections import namedtuple
+
+Page = namedtuple('Page', 'url doc_id content_hash etag last_modified deleted')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    doc_id INTEGER UNIQUE NOT NULL,
+    content_hash TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frontier_order ON frontier (priority, seq);
+"""
+
+
+class CrawlState:
+    """Состояние обхода в SQLite: url -> doc_id, хэш содержимого, ETag,
+    Last-Modified и очередь ещё не скачанных ссылок.
+
+    Благодаря ему перезапуск продолжает обход с того же места, а повторный
+    обход (recrawl) шлёт условные запросы и пропускает неизменные страницы.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def page(self, url):
+        row = self.db.execute("SELECT url, doc_id, content_hash, etag, last_modified, deleted "
+                              "FROM pages WHERE url = ?", (url,)).fetchone()
+        return Page(*row) if row else None
+
+    def page_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def next_doc_id(self):
+        return self.db.execute("SELECT COALESCE(MAX(doc_id), 0) + 1 FROM pages").fetchone()[0]
+
+    def known_urls(self):
+        rows = self.db.execute("SELECT url FROM pages UNION SELECT url FROM frontier")
+        return {row[0] for row in rows}
+
+    def save_page(self, url, doc_id, content_hash, etag, last_modified):
+        self.db.execute("INSERT OR REPLACE INTO pages (url, doc_id, content_hash, etag, last_modified, deleted) "
+                        "VALUES (?, ?, ?, ?, ?, 0)", (url, doc_id, content_hash, etag, last_modified))
+
+    def mark_deleted(self, url):
+        self.db.execute("UPDATE pages SET deleted = 1 WHERE url = ?", (url,))
+
+    def push(self, url, priority=1):
+        """Добавляет ссылку в очередь; уже стоящая в очереди ссылка не дублируется"""
+        self._seq += 1
+        self.db.execute("INSERT OR IGNORE INTO frontier (url, priority, seq) VALUES (?, ?, ?)",
+                        (url, priority, self._seq))
+
+    def peek(self):
+        row = self.db.execute("SELECT url FROM frontier ORDER BY priority, seq LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def frontier(self):
+        return [row[0] for row in self.db.execute("SELECT url FROM frontier ORDER BY priority, seq")]
+
+    def done(self, url):
+        self.db.execute("DELETE FROM frontier WHERE url = ?", (url,))
+
+    def import_index(self, index_file):
+        """Переносит в состояние страницы из index.txt, скачанные до появления состояния"""
+        with open(index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split(':', 1)
+                if len(parts) == 2 and parts[0].strip().isdigit():
+                    self.db.execute("INSERT OR IGNORE INTO pages (url, doc_id) VALUES (?, ?)",
+                                    (parts[1].strip(), int(parts[0])))
+
+    def requeue_known(self):
+        """Ставит все известные страницы в начало очереди для повторного обхода"""
+        for (url,) in self.db.execute("SELECT url FROM pages WHERE deleted = 0 ORDER BY doc_id").fetchall():
+            self._seq += 1
+            self.db.execute("INSERT OR REPLACE INTO frontier (url, priority, seq) VALUES (?, 0, ?)",
+                            (url, self._seq))
+
+
+def merge_status(old, new):
+    """Состояние документа после двух изменений подряд: побеждает последнее, но
+    изменённый после добавления документ остаётся новым (индексы его ещё не видели)"""
+    if old == 'added' and new == 'modified':
+        return old
+    return new
+
+
+class ChangeLog:
+    """Какие документы добавились, изменились или пропали за этот обход"""
+
+    def __init__(self):
+        self.added = []
+        self.modified = []
+        self.deleted = []
+        self.unchanged = 0
+
+    def statuses(self):
+        """{doc_id: 'added' | 'modified' | 'deleted'} - последнее изменение каждого документа"""
+        result = {}
+        for status in ('added', 'modified', 'deleted'):
+            for doc_id in getattr(self, status):
+                result[doc_id] = merge_status(result.get(doc_id), status)
+        return result
+
+    def write(self, path):
+        """Дописывает изменения в манифест: записи прошлых обходов, ещё не применённых
+        через --update, не теряются, для каждого документа остаётся последнее состояние.
+        Обновления по манифесту можно повторять, поэтому накопленный список безопасен;
+        начать его заново - crawler.py --new-manifest."""
+        statuses = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                old = json.load(f)
+            for status in ('added', 'modified', 'deleted'):
+                for doc_id in old.get(status, []):
+                    statuses[doc_id] = status
+        for doc_id, status in self.statuses().items():
+            statuses[doc_id] = merge_status(statuses.get(doc_id), status)
+
+        manifest = {status: sorted(doc_id for doc_id, value in statuses.items() if value == status)
+                    for status in ('added', 'modified', 'deleted')}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        return (f"новых: {len(self.added)}, изменённых: {len(self.modified)}, "
+                f"удалённых: {len(self.deleted)}, без изменений: {self.unchanged}")
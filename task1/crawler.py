@@ -1,58 +1,213 @@
 import os
-import requests
 import time
-from bs4 import BeautifulSoup
+import hashlib
+import argparse
 from urllib.parse import urljoin
 
+import requests
+from bs4 import BeautifulSoup
+
+from crawl_state import CrawlState, ChangeLog
+from pages import PAGE_FORMATS, find_page, read_page, write_page
+
 base_url = "https://lapkins.ru/dog/"
 
-output_folder = "выкачка"
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
+task_dir = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(task_dir, "выкачка")
+index_file = os.path.join(task_dir, "index.txt")
+state_file = os.path.join(task_dir, "crawl_state.sqlite")
+manifest_file = os.path.join(task_dir, "changed_docs.json")
+# pretty - prettify() от BeautifulSoup, raw / gzip - компактные байты ответа (см. pages.py)
+page_format = "pretty"
 
-index_file = "index.txt"
 
-# Уже посещенные страницы
-visited_urls = set()
+def save_page(html, index, url, output_folder, index_out, base=None, body=None, page_format="pretty"):
+    """Сохраняет страницу и строку индекса, возвращает ссылки со страницы"""
+    soup = BeautifulSoup(html, 'html.parser')
 
-# Еще не посещенные страницы
-urls_to_visit = [base_url]
+    # Сохраняем HTML-код страницы: отформатированный текстом или байты ответа как есть
+    if page_format == "pretty" or body is None:
+        write_page(output_folder, index, soup.prettify().encode("utf-8"), "pretty")
+    else:
+        write_page(output_folder, index, body, page_format)
 
-def download_page(url, index, index_file):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
+    # Также записываем ссылку на страницу в index (файл открыт на всё время обхода).
+    # У обновлённой страницы номер прежний, строка в index уже есть
+    if index_out is not None:
+        index_out.write(f"{index}: {url}\n")
+
+    print(f"Страница {index} успешно скачана: {url}")
+
+    return extract_links(soup, base)
 
-        # Сохраняем HTML-код страницы в текстовый файл
-        filename = os.path.join(output_folder, f"page_{index}.txt")
-        with open(filename, "w", encoding="utf-8") as file:
-            file.write(soup.prettify())
 
-        # Также записываем ссылку на страницу в index
-        with open(index_file, "a", encoding="utf-8") as idx_file:
-            idx_file.write(f"{index}: {url}\n")
+def extract_links(soup, base=None):
+    # Возвращаем все ссылки на странице, исключая те, которые содержат "porodi"
+    # Потому что там просто сгруппированные списки пород, текста мало
+    return [urljoin(base or base_url, a['href']) for a in soup.find_all('a', href=True) if "porodi" not in a['href']]
+
+
+def conditional_headers(page, output_folder):
+    """Заголовки условного запроса по данным прошлого обхода"""
+    headers = {}
+    # Без сохранённой копии на 304 нечего будет разбирать, поэтому спрашиваем страницу целиком
+    if page is None or find_page(output_folder, page.doc_id) is None:
+        return headers
+    if not page.deleted:
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+    return headers
+
+
+def handle_response(state, changes, url, status, headers, body, text, output_folder, index_out, base=None,
+                    page_format="pretty"):
+    """Разбирает ответ с учётом сохранённого состояния, возвращает ссылки со страницы.
+
+    304 и совпавший хэш содержимого - страница не изменилась, файл не трогаем;
+    404/410 у известной страницы - она удалена вместе с сохранённым файлом.
+    """
+    page = state.page(url)
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+
+    if status == 304 and page is not None:
+        state.save_page(url, page.doc_id, page.content_hash, etag or page.etag, last_modified or page.last_modified)
+        changes.unchanged += 1
+        # Ссылки берём из сохранённой копии страницы
+        html = read_page(find_page(output_folder, page.doc_id))
+        return extract_links(BeautifulSoup(html, 'html.parser'), base)
+
+    if status in (404, 410):
+        if page is not None:
+            if not page.deleted:
+                state.mark_deleted(url)
+                changes.deleted.append(page.doc_id)
+                print(f"Страница {page.doc_id} удалена: {url}")
+            # Файл страницы тоже убираем, иначе полная пересборка (list_pages) вернёт
+            # удалённый документ в индекс; заодно подчищаем копии, оставшиеся от старых обходов
+            path = find_page(output_folder, page.doc_id)
+            if path is not None:
+                os.remove(path)
+        return []
 
-        print(f"Страница {index} успешно скачана: {url}")
+    content_hash = hashlib.sha256(body).hexdigest()
+    if page is not None and not page.deleted and page.content_hash == content_hash:
+        state.save_page(url, page.doc_id, content_hash, etag, last_modified)
+        changes.unchanged += 1
+        return extract_links(BeautifulSoup(text, 'html.parser'), base)
 
-        # Возвращаем все ссылки на странице, исключая те, которые содержат "porodi"
-        # Потому что там просто сгруппированные списки пород, текста мало
-        return [urljoin(base_url, a['href']) for a in soup.find_all('a', href=True) if "porodi" not in a['href']]
+    if page is None:
+        doc_id = state.next_doc_id()
+        changes.added.append(doc_id)
+    else:
+        doc_id = page.doc_id
+        (changes.added if page.deleted else changes.modified).append(doc_id)
+
+    links = save_page(text, doc_id, url, output_folder, index_out if page is None else None, base,
+                      body=body, page_format=page_format)
+    state.save_page(url, doc_id, content_hash, etag, last_modified)
+    return links
+
+
+def download_page(session, state, changes, url, index_out):
+    try:
+        response = session.get(url, headers=conditional_headers(state.page(url), output_folder))
+        if response.status_code not in (304, 404, 410):
+            response.raise_for_status()
+        return handle_response(state, changes, url, response.status_code, response.headers,
+                               response.content, response.text, output_folder, index_out,
+                               page_format=page_format)
 
     except requests.RequestException as e:
         print(f"Ошибка при скачивании страницы {url}: {e}")
         return []
 
-index = 1
 
-# Проходим 100 страниц
-while urls_to_visit and index <= 100:
-    current_url = urls_to_visit.pop(0)
-    if current_url not in visited_urls:
-        visited_urls.add(current_url)   # После посещения страницы добавляем ее в множество посещенных
-        new_urls = download_page(current_url, index, index_file)
-        urls_to_visit.extend(new_urls)
-        index += 1
-        time.sleep(1)  # Делаем паузу в 1 секунду, чтобы не перегружать сервер и нас не забанили
+def crawl(state, changes, max_pages=100, delay=1.0):
+    # Все ссылки, которые уже скачаны или стоят в очереди (дубликаты отсекаем сразу)
+    seen_urls = state.known_urls()
+
+    # Одна сессия - одно keep-alive соединение на хост вместо нового на каждую страницу
+    with requests.Session() as session, open(index_file, "a", encoding="utf-8") as index_out:
+        while True:
+            current_url = state.peek()
+            if current_url is None:
+                break
+            # Новые страницы берём, только пока не набрали max_pages документов;
+            # остаток очереди сохранится для следующего запуска
+            if state.page(current_url) is None and state.page_count() >= max_pages:
+                break
+
+            new_urls = download_page(session, state, changes, current_url, index_out)
+            for url in new_urls:
+                if url not in seen_urls:
+                    seen_urls.add(url)
+                    state.push(url)
+            state.done(current_url)
+            state.commit()
+            time.sleep(delay)  # Делаем паузу, чтобы не перегружать сервер и нас не забанили
+
+
+def main():
+    global base_url, output_folder, index_file, page_format
+
+    parser = argparse.ArgumentParser(description="Обход сайта и выкачка страниц")
+    parser.add_argument('--base-url', default=base_url)
+    parser.add_argument('--output', default=output_folder, help="папка для страниц")
+    parser.add_argument('--index-file', default=index_file)
+    parser.add_argument('--format', dest='page_format', choices=sorted(PAGE_FORMATS), default=page_format,
+                        help="как хранить страницы: pretty - отформатированный HTML, "
+                             "raw - байты ответа, gzip - сжатые байты ответа")
+    parser.add_argument('--state', default=state_file, help="файл состояния обхода (SQLite)")
+    parser.add_argument('--manifest', default=manifest_file, help="куда записать список изменённых документов")
+    parser.add_argument('--new-manifest', action='store_true',
+                        help="начать список изменённых документов заново (прошлый уже применён через --update)")
+    parser.add_argument('--recrawl', action='store_true',
+                        help="заново проверить все известные страницы условными запросами")
+    parser.add_argument('--max-pages', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=1.0, help="пауза между запросами в обычном режиме, с")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="асинхронный режим с пулом воркеров и ограничением частоты по хостам")
+    parser.add_argument('--workers', type=int, default=8, help="число воркеров в асинхронном режиме")
+    parser.add_argument('--rate', type=float, default=1.0, help="запросов в секунду на один хост")
+    parser.add_argument('--burst', type=int, default=1, help="сколько запросов к хосту можно сделать подряд")
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    output_folder = args.output
+    index_file = args.index_file
+    page_format = args.page_format
+    os.makedirs(output_folder, exist_ok=True)
+
+    state = CrawlState(args.state)
+    if state.page_count() == 0 and os.path.exists(index_file):
+        state.import_index(index_file)
+    if args.recrawl:
+        state.requeue_known()
+    if state.page_count() == 0 and state.peek() is None:
+        state.push(base_url)
+    changes = ChangeLog()
+    if args.new_manifest and os.path.exists(args.manifest):
+        os.remove(args.manifest)
+
+    try:
+        if args.use_async:
+            from async_crawler import AsyncCrawler
+
+            crawler = AsyncCrawler(base_url, output_folder, index_file, state, changes,
+                                   max_pages=args.max_pages, workers=args.workers,
+                                   rate=args.rate, burst=args.burst, page_format=page_format)
+            crawler.run()
+        else:
+            crawl(state, changes, max_pages=args.max_pages, delay=args.delay)
+    finally:
+        state.close()
+        changes.write(args.manifest)
+
+    print(f"Все страницы скачаны. {changes.summary()}")
+
 
-print("Все страницы скачаны.")
+if __name__ == "__main__":
+    main()
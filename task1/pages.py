@@ -0,0 +1,54 @@
+import os
+import re
+import gzip
+
+# Форматы хранения выкачанной страницы:
+# pretty - HTML после BeautifulSoup.prettify() (как раньше), raw - байты ответа как есть,
+# gzip - те же байты, сжатые gzip
+PAGE_FORMATS = {'pretty': '.txt', 'raw': '.html', 'gzip': '.html.gz'}
+PAGE_RE = re.compile(r'^page_(\d+)(\.txt|\.html|\.html\.gz)$')
+
+
+def page_path(folder, doc_id, page_format='pretty'):
+    return os.path.join(folder, f"page_{doc_id}{PAGE_FORMATS[page_format]}")
+
+
+def find_page(folder, doc_id):
+    """Путь к сохранённой странице в любом из форматов или None"""
+    for page_format in PAGE_FORMATS:
+        path = page_path(folder, doc_id, page_format)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def list_pages(folder):
+    """[(doc_id, путь)] всех страниц папки по возрастанию номера"""
+    pages = []
+    for filename in os.listdir(folder):
+        match = PAGE_RE.match(filename)
+        if match:
+            pages.append((int(match.group(1)), os.path.join(folder, filename)))
+    pages.sort()
+    return pages
+
+
+def read_page(path):
+    """Байты сохранённой страницы (сжатые распаковываются)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return gzip.decompress(data) if path.endswith('.gz') else data
+
+
+def write_page(folder, doc_id, data, page_format='pretty'):
+    """Сохраняет страницу и удаляет её копии в других форматах"""
+    path = page_path(folder, doc_id, page_format)
+    if page_format == 'gzip':
+        data = gzip.compress(data)
+    with open(path, 'wb') as f:
+        f.write(data)
+    for other in PAGE_FORMATS:
+        other_path = page_path(folder, doc_id, other)
+        if other_path != path and os.path.exists(other_path):
+            os.remove(other_path)
+    return path
@@ -0,0 +1,97 @@
+import os
+import re
+import sys
+import hashlib
+import tempfile
+
+import lxml.html
+from lxml import etree
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'task1'))
+
+from pages import read_page
+
+# Элементы, текст которых не относится к содержимому страницы
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'nav', 'footer', 'aside')
+CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+text_cache_dir = os.path.join(project_root, 'task2', 'text_cache')
+
+
+def decode_html(data):
+    """Байты страницы -> строка: UTF-8, иначе кодировка из <meta charset>, иначе cp1251"""
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        match = CHARSET_RE.search(data[:4096])
+        encoding = match.group(1).decode('ascii') if match else 'cp1251'
+        try:
+            return data.decode(encoding, errors='replace')
+        except LookupError:
+            return data.decode('cp1251', errors='replace')
+
+
+def extract_text(html):
+    """Текст страницы без разметки, скриптов, стилей, меню и подвала"""
+    if isinstance(html, bytes):
+        html = decode_html(html)
+    if not html.strip():
+        return ''
+    try:
+        tree = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ''
+    etree.strip_elements(tree, etree.Comment, *BOILERPLATE_TAGS, with_tail=False)
+
+    # Текстовые узлы разделяем переводом строки (prettify и так ставит его вокруг
+    # каждого тега), чтобы слова соседних блоков не склеились
+    parts = []
+    for text in tree.itertext():
+        text = text.strip()
+        if text:
+            parts.append(text)
+    return '\n'.join(parts)
+
+
+class TextCache:
+    """Извлечённый текст страниц на диске, ключ - sha256 байтов страницы.
+
+    Разбор HTML выполняется один раз на версию страницы: неизменённые
+    страницы при следующих запусках берутся из кэша, изменённые получают
+    новый ключ сами собой.
+    """
+
+    def __init__(self, folder=text_cache_dir):
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.txt')
+
+    def get(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            self.hits += 1
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        self.misses += 1
+        text = extract_text(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Свой временный файл у каждого вызова: воркеры token&lemm.py --workers
+        # делят одну папку кэша и могут одновременно писать страницы с одинаковым содержимым
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return text
+
+
+def page_text(path, cache=None):
+    """Чистый текст сохранённой страницы (через кэш, если он передан)"""
+    data = read_page(path)
+    return cache.get(data) if cache is not None else extract_text(data)
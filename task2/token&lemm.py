@@ -1,55 +1,125 @@
 import os
-import re
-import nltk
-from pymorphy2 import MorphAnalyzer
-from nltk.corpus import stopwords
+import json
+import argparse
 from collections import defaultdict
+from multiprocessing import Pool
+
+from pymorphy2 import MorphAnalyzer
+
+from tokenizer import Tokenizer
+from extract import TextCache, page_text
+from pages import list_pages, find_page
 
-nltk.download('stopwords')
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Общий токенизатор: стоп-слова и регулярки готовятся один раз,
+# а кэш лемм сохраняется между запусками
+tokenizer = Tokenizer(cache_file=os.path.join(project_root, 'task2', 'lemma_cache.txt'))
 
-morph = MorphAnalyzer()
 
 def tokenize_text(text):
-    text = re.sub(r'[^а-яА-Я\s-]', '', text)
-    tokens = re.findall(r'\b[а-яА-Я-]+\b', text)
-    tokens = [word.lower() for word in tokens]
-    stop_words = set(stopwords.words('russian'))
-    tokens = [word for word in tokens if word not in stop_words]
-    tokens = [word for word in tokens if not any(char.isdigit() for char in word)]
-    return list(set(tokens))
+    return tokenizer.tokens(text)
 
 
-def process_documents(input_folder, output_tokens_dir, output_lemmas_dir):
-    os.makedirs(output_tokens_dir, exist_ok=True)
-    os.makedirs(output_lemmas_dir, exist_ok=True)
+def process_file(path, output_tokens_dir, output_lemmas_dir, tokenizer, text_cache=None):
+    """Токенизация и лемматизация одного документа, пишет его файлы"""
+    doc_id = os.path.basename(path).split('.')[0]
 
-    all_tokens = set()
-    all_lemmas = defaultdict(set)
+    # Токенизируем не HTML целиком, а только извлечённый текст страницы
+    text = page_text(path, text_cache)
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".txt"):
-            doc_id = filename.split('.')[0]
+    tokens = tokenizer.tokens(text)
 
-            with open(os.path.join(input_folder, filename), 'r', encoding='utf-8') as f:
-                text = f.read()
+    token_file = os.path.join(output_tokens_dir, f'{doc_id}_tokens.txt')
+    with open(token_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(tokens))
 
-            tokens = tokenize_text(text)
-            all_tokens.update(tokens)
+    lemmatized = defaultdict(list)
+    for token in tokens:
+        lemma = tokenizer.lemmatize(token)
+        lemmatized[lemma].append(token)
+
+    lemma_file = os.path.join(output_lemmas_dir, f'{doc_id}_lemmas.txt')
+    with open(lemma_file, 'w', encoding='utf-8') as f:
+        for lemma, forms in lemmatized.items():
+            f.write(f"{lemma}: {' '.join(forms)}\n")
+
+    return tokens, lemmatized
+
+
+# Токенизатор процесса-воркера (свой MorphAnalyzer в каждом процессе)
+worker_tokenizer = None
+worker_text_cache = None
+
+
+def init_worker(stop_words, cache):
+    global worker_tokenizer, worker_text_cache
+    worker_tokenizer = Tokenizer(morph=MorphAnalyzer(), stop_words=stop_words)
+    worker_tokenizer.cache.update(cache)
+    worker_text_cache = TextCache()
 
-            token_file = os.path.join(output_tokens_dir, f'{doc_id}_tokens.txt')
-            with open(token_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(tokens))
 
-            lemmatized = defaultdict(list)
-            for token in tokens:
-                lemma = morph.parse(token)[0].normal_form.lower()
-                lemmatized[lemma].append(token)
-                all_lemmas[lemma].add(token)
+def process_file_in_worker(args):
+    hits, misses = worker_tokenizer.hits, worker_tokenizer.misses
+    tokens, lemmatized = process_file(*args, worker_tokenizer, worker_text_cache)
+    return tokens, dict(lemmatized), worker_tokenizer.hits - hits, worker_tokenizer.misses - misses
 
-            lemma_file = os.path.join(output_lemmas_dir, f'{doc_id}_lemmas.txt')
-            with open(lemma_file, 'w', encoding='utf-8') as f:
+
+def read_global_files():
+    """Читает общие tokens.txt и lemmatized_tokens.txt прошлого запуска"""
+    all_tokens = set()
+    all_lemmas = defaultdict(set)
+    tokens_file = os.path.join(project_root, 'task2', 'tokens.txt')
+    lemmas_file = os.path.join(project_root, 'task2', 'lemmatized_tokens.txt')
+    if os.path.exists(tokens_file):
+        with open(tokens_file, 'r', encoding='utf-8') as f:
+            all_tokens.update(line.strip() for line in f if line.strip())
+    if os.path.exists(lemmas_file):
+        with open(lemmas_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split(': ')
+                if len(parts) == 2:
+                    all_lemmas[parts[0]].update(parts[1].split())
+    return all_tokens, all_lemmas
+
+
+def process_documents(input_folder, output_tokens_dir, output_lemmas_dir, workers=1, doc_ids=None):
+    """doc_ids - обработать только эти документы и дополнить ими общие словари"""
+    os.makedirs(output_tokens_dir, exist_ok=True)
+    os.makedirs(output_lemmas_dir, exist_ok=True)
+
+    if doc_ids is None:
+        all_tokens = set()
+        all_lemmas = defaultdict(set)
+        paths = [path for _, path in list_pages(input_folder)]
+    else:
+        all_tokens, all_lemmas = read_global_files()
+        paths = [find_page(input_folder, doc_id) for doc_id in doc_ids]
+        paths = [path for path in paths if path is not None]
+
+    if workers > 1:
+        # Раскидываем файлы по процессам, а общие словари собираем здесь
+        tasks = [(path, output_tokens_dir, output_lemmas_dir) for path in paths]
+        with Pool(workers, initializer=init_worker,
+                  initargs=(tokenizer.stop_words, dict(tokenizer.cache))) as pool:
+            results = pool.imap_unordered(process_file_in_worker, tasks,
+                                          chunksize=max(1, len(tasks) // (workers * 8)))
+            for tokens, lemmatized, hits, misses in results:
+                tokenizer.hits += hits
+                tokenizer.misses += misses
                 for lemma, forms in lemmatized.items():
-                    f.write(f"{lemma}: {' '.join(forms)}\n")
+                    for form in forms:
+                        tokenizer.cache[form] = lemma
+                all_tokens.update(tokens)
+                for lemma, forms in lemmatized.items():
+                    all_lemmas[lemma].update(forms)
+    else:
+        text_cache = TextCache()
+        for path in paths:
+            tokens, lemmatized = process_file(path, output_tokens_dir, output_lemmas_dir, tokenizer, text_cache)
+            all_tokens.update(tokens)
+            for lemma, forms in lemmatized.items():
+                all_lemmas[lemma].update(forms)
 
     with open(os.path.join(project_root, 'task2', 'tokens.txt'), 'w', encoding='utf-8') as f:
         f.write('\n'.join(sorted(all_tokens)))
@@ -58,15 +128,47 @@ def process_documents(input_folder, output_tokens_dir, output_lemmas_dir):
         for lemma in sorted(all_lemmas.keys()):
             f.write(f"{lemma}: {' '.join(sorted(all_lemmas[lemma]))}\n")
 
+    tokenizer.save_cache()
+    info = tokenizer.cache_info()
+    print(f"Кэш лемм: попаданий {info['hits']}, промахов {info['misses']}, "
+          f"доля попаданий {info['hit_rate']:.1%}, размер {info['size']}")
+
+
+def update_documents(input_folder, output_tokens_dir, output_lemmas_dir, manifest_file, workers=1):
+    """Обрабатывает только новые и изменённые документы из task1/changed_docs.json,
+    у удалённых стирает их файлы токенов и лемм.
+
+    Общие словари только пополняются: слова удалённых документов
+    уходят из них при следующей полной обработке.
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        changes = json.load(f)
+
+    for doc_id in changes.get('deleted', []):
+        for path in (os.path.join(output_tokens_dir, f'page_{doc_id}_tokens.txt'),
+                     os.path.join(output_lemmas_dir, f'page_{doc_id}_lemmas.txt')):
+            if os.path.exists(path):
+                os.remove(path)
+
+    changed = sorted(set(changes.get('added', []) + changes.get('modified', [])))
+    process_documents(input_folder, output_tokens_dir, output_lemmas_dir, workers=workers, doc_ids=changed)
+
 
 def main():
-    global project_root
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Токенизация и лемматизация выкачанных страниц")
+    parser.add_argument('--workers', type=int, default=1, help="число процессов (по умолчанию 1)")
+    parser.add_argument('--update', nargs='?', const=os.path.join(project_root, 'task1', 'changed_docs.json'),
+                        metavar='MANIFEST', help="обработать только изменённые документы")
+    args = parser.parse_args()
+
     input_folder = os.path.join(project_root, 'task1', 'выкачка')
     output_tokens = os.path.join(project_root, 'task2', 'tokens')
     output_lemmas = os.path.join(project_root, 'task2', 'lemmas')
 
-    process_documents(input_folder, output_tokens, output_lemmas)
+    if args.update:
+        update_documents(input_folder, output_tokens, output_lemmas, args.update, workers=args.workers)
+    else:
+        process_documents(input_folder, output_tokens, output_lemmas, workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+import os
+import re
+from collections import OrderedDict
+
+import nltk
+from nltk.corpus import stopwords
+from pymorphy2 import MorphAnalyzer
+
+# Всё, кроме кириллицы, пробелов и дефиса, выкидываем
+CLEAN_RE = re.compile(r'[^а-яА-Я\s-]')
+WORD_RE = re.compile(r'\b[а-яА-Я-]+\b')
+
+
+def load_stop_words():
+    try:
+        words = stopwords.words('russian')
+    except LookupError:
+        nltk.download('stopwords')
+        words = stopwords.words('russian')
+    return frozenset(words)
+
+
+class Tokenizer:
+    """Токенизатор и лемматизатор с общим кэшем "токен -> лемма".
+
+    Регулярки компилируются один раз, стоп-слова хранятся в frozenset.
+    Кэш общий для всех документов (cache_size=None - без ограничения,
+    иначе LRU) и может сохраняться между запусками в cache_file.
+    """
+
+    def __init__(self, morph=None, stop_words=None, cache_size=None, cache_file=None):
+        self._morph = morph
+        self.stop_words = frozenset(stop_words) if stop_words is not None else load_stop_words()
+        self.cache_size = cache_size
+        self.cache_file = cache_file
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cache_file and os.path.exists(cache_file):
+            self.load_cache(cache_file)
+
+    @property
+    def morph(self):
+        # MorphAnalyzer тяжёлый, создаём только когда он реально нужен
+        if self._morph is None:
+            self._morph = MorphAnalyzer()
+        return self._morph
+
+    def iter_tokens(self, text):
+        """Все вхождения слов текста по порядку (с повторами), без стоп-слов"""
+        text = CLEAN_RE.sub('', text)
+        stop_words = self.stop_words
+        for match in WORD_RE.finditer(text):
+            word = match.group().lower()
+            if word not in stop_words:
+                yield word
+
+    def iter_positions(self, text):
+        """(позиция, слово) для слов текста без стоп-слов; позиция - номер слова
+        в тексте, стоп-слова тоже занимают позицию, чтобы фразы не склеивались"""
+        text = CLEAN_RE.sub('', text)
+        stop_words = self.stop_words
+        for position, match in enumerate(WORD_RE.finditer(text)):
+            word = match.group().lower()
+            if word not in stop_words:
+                yield position, word
+
+    def tokens(self, text):
+        """Уникальные токены текста в порядке первого появления"""
+        return list(dict.fromkeys(self.iter_tokens(text)))
+
+    def lemmatize(self, token):
+        lemma = self.cache.get(token)
+        if lemma is not None:
+            self.hits += 1
+            if self.cache_size is not None:
+                self.cache.move_to_end(token)
+            return lemma
+
+        self.misses += 1
+        lemma = self.morph.parse(token)[0].normal_form.lower()
+        self.cache[token] = lemma
+        if self.cache_size is not None and len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return lemma
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.cache), 'hit_rate': hit_rate}
+
+    def load_cache(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    self.cache[parts[0]] = parts[1]
+        if self.cache_size is not None:
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def save_cache(self, path=None):
+        path = path or self.cache_file
+        if not path:
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            for token, lemma in self.cache.items():
+                f.write(f"{token} {lemma}\n")
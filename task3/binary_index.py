@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import mmap
+import struct
+
+# Формат файла (little-endian, все секции выровнены по 8 байт):
+#   заголовок HEADER (магия, версия, n_terms, n_docs, резерв, смещения секций)
+#   doc_ids          uint32 * n_docs        - все номера документов индекса
+#   doc_freqs        uint32 * n_terms       - длина списка каждого термина
+#   term_offsets     uint32 * (n_terms + 1) - границы терминов в terms_blob
+#   postings_offsets uint64 * (n_terms + 1) - границы списков в postings_blob
+#   terms_blob       термины в utf-8, отсортированы по байтам
+#   postings_blob    разности соседних номеров документов в varint
+MAGIC = b'OIPIDX\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIQQQQQQ')
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_postings(buf, start, end):
+    """Декодирует список номеров документов из varint-разностей"""
+    doc_ids = []
+    doc_id = 0
+    value = 0
+    shift = 0
+    for i in range(start, end):
+        byte = buf[i]
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            doc_id += value
+            doc_ids.append(doc_id)
+            value = 0
+            shift = 0
+    return doc_ids
+
+
+def _pad(out):
+    out.extend(b'\x00' * (-len(out) % 8))
+
+
+def write_binary_index(path, inverted_index, doc_ids=None):
+    """Записывает индекс {термин: номера документов} в бинарный файл"""
+    terms = sorted(inverted_index, key=lambda term: term.encode('utf-8'))
+    if doc_ids is None:
+        doc_ids = set()
+        for postings in inverted_index.values():
+            doc_ids.update(postings)
+    doc_ids = sorted(doc_ids)
+
+    terms_blob = bytearray()
+    term_offsets = [0]
+    postings_blob = bytearray()
+    postings_offsets = [0]
+    doc_freqs = []
+    for term in terms:
+        terms_blob.extend(term.encode('utf-8'))
+        term_offsets.append(len(terms_blob))
+
+        postings = sorted(set(inverted_index[term]))
+        previous = 0
+        for doc_id in postings:
+            encode_varint(doc_id - previous, postings_blob)
+            previous = doc_id
+        postings_offsets.append(len(postings_blob))
+        doc_freqs.append(len(postings))
+
+    body = bytearray()
+    offsets = []
+    for fmt, values in (('I', doc_ids), ('I', doc_freqs), ('I', term_offsets), ('Q', postings_offsets)):
+        offsets.append(HEADER.size + len(body))
+        body.extend(struct.pack(f'<{len(values)}{fmt}', *values))
+        _pad(body)
+    offsets.append(HEADER.size + len(body))
+    body.extend(terms_blob)
+    _pad(body)
+    offsets.append(HEADER.size + len(body))
+    body.extend(postings_blob)
+
+    header = HEADER.pack(MAGIC, VERSION, len(terms), len(doc_ids), 0, *offsets)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+class BinaryInvertedIndex:
+    """Бинарный индекс, открытый через mmap.
+
+    При открытии читается только заголовок, списки словопозиций
+    декодируются по запросу. Ведёт себя как словарь {термин: [номера]}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        (magic, version, n_terms, n_docs, _,
+         docs_off, freqs_off, term_offsets_off, postings_offsets_off,
+         terms_off, postings_off) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не бинарный индекс или неподдерживаемая версия")
+
+        self.n_terms = n_terms
+        self.doc_ids = buf[docs_off:docs_off + 4 * n_docs].cast('I')
+        self._doc_freqs = buf[freqs_off:freqs_off + 4 * n_terms].cast('I')
+        self._term_offsets = buf[term_offsets_off:term_offsets_off + 4 * (n_terms + 1)].cast('I')
+        self._postings_offsets = buf[postings_offsets_off:postings_offsets_off + 8 * (n_terms + 1)].cast('Q')
+        self._terms = buf[terms_off:postings_off]
+        self._postings = buf[postings_off:]
+        self._buf = buf
+
+    def close(self):
+        for view in (self.doc_ids, self._doc_freqs, self._term_offsets,
+                     self._postings_offsets, self._terms, self._postings, self._buf):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _term_at(self, i):
+        return bytes(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _find(self, term):
+        key = term.encode('utf-8')
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._term_at(lo) == key:
+            return lo
+        return None
+
+    def __len__(self):
+        return self.n_terms
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __iter__(self):
+        for i in range(self.n_terms):
+            yield self._term_at(i).decode('utf-8')
+
+    def keys(self):
+        return iter(self)
+
+    def __getitem__(self, term):
+        i = self._find(term)
+        if i is None:
+            raise KeyError(term)
+        return decode_postings(self._postings, self._postings_offsets[i], self._postings_offsets[i + 1])
+
+    def get(self, term, default=None):
+        try:
+            return self[term]
+        except KeyError:
+            return default
+
+    def items(self):
+        for i in range(self.n_terms):
+            yield (self._term_at(i).decode('utf-8'),
+                   decode_postings(self._postings, self._postings_offsets[i], self._postings_offsets[i + 1]))
+
+    def doc_freq(self, term):
+        """Длина списка без его декодирования"""
+        i = self._find(term)
+        return self._doc_freqs[i] if i is not None else 0
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+def load_inverted_index(bin_path, json_path):
+    """Открывает бинарный индекс (вместе с сегментами обновлений, если они есть),
+    а если его нет - читает JSON"""
+    if os.path.exists(os.path.join(os.path.dirname(bin_path), 'segments', 'segments.json')):
+        from segments import SegmentedIndex
+        return SegmentedIndex(bin_path)
+    if os.path.exists(bin_path):
+        return BinaryInvertedIndex(bin_path)
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    # Выгрузка бинарного индекса в JSON для отладки:
+    # python binary_index.py inverted_index.bin inverted_index.json
+    if len(sys.argv) != 3:
+        print("Использование: python binary_index.py <индекс.bin> <выход.json>")
+        sys.exit(1)
+    with BinaryInvertedIndex(sys.argv[1]) as index:
+        with open(sys.argv[2], 'w', encoding='utf-8') as f:
+            json.dump(index.to_dict(), f, ensure_ascii=False, indent=4)
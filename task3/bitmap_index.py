@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+
+def to_bitmap(doc_ids):
+    """Список номеров документов -> битовая маска (int, бит i = документ i)"""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return 0
+    buf = bytearray(max(doc_ids) // 8 + 1)
+    for doc_id in doc_ids:
+        buf[doc_id >> 3] |= 1 << (doc_id & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def from_bitmap(bits):
+    """Битовая маска -> отсортированный список номеров документов"""
+    doc_ids = []
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        # Пустые байты пропускаем сразу, для редких терминов их большинство
+        if byte:
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    doc_ids.append(base + bit)
+    return doc_ids
+
+
+if hasattr(int, 'bit_count'):
+    def popcount(bits):
+        return bits.bit_count()
+else:
+    def popcount(bits):
+        return bin(bits).count('1')
+
+
+class BitmapIndex:
+    """Инвертированный индекс со списками в виде битовых масок.
+
+    Маски - это целые числа Python: AND/OR/NOT над ними выполняются
+    пословно на C. Маски терминов строятся при первом обращении и кэшируются
+    (LRU на term_cache_size масок: каждая занимает до N/8 байт).
+    NOT считается как дополнение до маски живых документов live_docs.
+    version увеличивается при каждой замене индекса, по нему сбрасываются
+    кэши, построенные поверх BitmapIndex.
+    """
+
+    def __init__(self, inverted_index, doc_ids=None, term_cache_size=4096):
+        self.version = 0
+        self.term_cache_size = term_cache_size
+        self._load(inverted_index, doc_ids)
+
+    def _load(self, inverted_index, doc_ids):
+        self.inverted_index = inverted_index
+        if doc_ids is None:
+            doc_ids = getattr(inverted_index, 'doc_ids', None)
+        if doc_ids is None:
+            doc_ids = set()
+            for postings in inverted_index.values():
+                doc_ids.update(postings)
+        self.live_docs = to_bitmap(doc_ids)
+        self.live_count = popcount(self.live_docs)
+        self._bitmaps = OrderedDict()
+
+    def reload(self, inverted_index, doc_ids=None):
+        """Подменяет индекс (например, после перестроения) и сбрасывает кэши"""
+        self._load(inverted_index, doc_ids)
+        self.version += 1
+
+    def term(self, term):
+        bits = self._bitmaps.get(term)
+        if bits is not None:
+            self._bitmaps.move_to_end(term)
+            return bits
+
+        bits = to_bitmap(self.inverted_index.get(term, ()))
+        self._bitmaps[term] = bits
+        if len(self._bitmaps) > self.term_cache_size:
+            self._bitmaps.popitem(last=False)
+        return bits
+
+    def doc_freq(self, term):
+        bits = self._bitmaps.get(term)
+        if bits is not None:
+            return popcount(bits)
+        if hasattr(self.inverted_index, 'doc_freq'):
+            return self.inverted_index.doc_freq(term)
+        return len(self.inverted_index.get(term, ()))
+
+    def complement(self, bits):
+        return self.live_docs & ~bits
@@ -1,42 +1,143 @@
 import os
+import sys
 import json
+import time
+import shutil
+import argparse
 from collections import defaultdict
 
-def read_tokens(filename):
-    tokens = set()
-    with open(filename, 'r', encoding='utf-8') as file:
-        for line in file:
-            token = line.strip()
-            if token:
-                tokens.add(token)
-    return tokens
-
-def build_inverted_index(folder_path, tokens):
-    inverted_index = defaultdict(set)
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".txt"):
-            doc_id = int(filename.replace("page_", "").replace(".txt", ""))
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
-                text = file.read()
-                for token in tokens:
-                    if token in text:
-                        inverted_index[token].add(doc_id)
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'task2'))
+
+from tokenizer import Tokenizer
+from extract import TextCache, page_text
+from pages import list_pages, find_page
+from binary_index import write_binary_index
+from segments import SegmentedIndex
+from positional_index import write_positional_index
+
+
+def build_inverted_index(folder_path, tokenizer=None, report_every=1000, doc_ids=None, text_cache=None,
+                         positions=None):
+    """Строит индекс за один проход: каждая страница токенизируется ровно один раз,
+    и её множество терминов сразу попадает в списки словопозиций.
+    doc_ids - проиндексировать только эти документы.
+    positions - словарь, в который за тот же проход собираются позиции
+    {термин: [(doc_id, [позиции])]} для позиционного индекса"""
+    tokenizer = tokenizer or Tokenizer()
+    text_cache = text_cache or TextCache()
+    inverted_index = defaultdict(list)
+
+    # Идём по возрастанию номера, тогда списки словопозиций сразу отсортированы
+    if doc_ids is None:
+        pages = list_pages(folder_path)
+    else:
+        pages = [(doc_id, find_page(folder_path, doc_id)) for doc_id in sorted(doc_ids)]
+        pages = [(doc_id, path) for doc_id, path in pages if path is not None]
+
+    start = time.perf_counter()
+    total_bytes = 0
+    for i, (doc_id, path) in enumerate(pages, 1):
+        text = page_text(path, text_cache)
+        total_bytes += len(text)
+
+        if positions is None:
+            for token in tokenizer.tokens(text):
+                inverted_index[token].append(doc_id)
+        else:
+            doc_positions = defaultdict(list)
+            for position, token in tokenizer.iter_positions(text):
+                doc_positions[token].append(position)
+            # Ключи - уникальные токены в порядке появления, как у tokenizer.tokens()
+            for token, token_positions in doc_positions.items():
+                inverted_index[token].append(doc_id)
+                positions.setdefault(token, []).append((doc_id, token_positions))
+
+        if i % report_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"Обработано {i}/{len(pages)} документов, {i / elapsed:.1f} док/с")
+
+    elapsed = time.perf_counter() - start
+    print(f"Проиндексировано {len(pages)} документов за {elapsed:.2f} с "
+          f"({len(pages) / max(elapsed, 1e-9):.1f} док/с, "
+          f"{total_bytes / max(elapsed, 1e-9) / 1024 / 1024:.2f} МБ/с), терминов: {len(inverted_index)}")
     return inverted_index
 
+
+def load_changes(manifest_file):
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        changes = json.load(f)
+    return changes.get('added', []), changes.get('modified', []), changes.get('deleted', [])
+
+
+def update_inverted_index(folder_path, index_file, manifest_file, tokenizer=None):
+    """Обновляет индекс по списку изменённых документов из task1/changed_docs.json.
+
+    Старые версии изменённых и удалённые документы помечаются надгробиями,
+    новые версии индексируются в отдельный сегмент. Работа пропорциональна
+    числу изменённых документов, а не размеру коллекции.
+    """
+    added, modified, deleted = load_changes(manifest_file)
+    index = SegmentedIndex(index_file)
+    try:
+        # Позиционный индекс сегментами не обновляется - устаревший лучше убрать
+        positions_file = os.path.splitext(index_file)[0] + '.pos'
+        if os.path.exists(positions_file):
+            os.remove(positions_file)
+            print(f"Позиционный индекс {positions_file} удалён, постройте его заново: build_index.py --positions")
+        index.delete(modified + deleted)
+        changed = sorted(set(added + modified))
+        if changed:
+            index.add_segment(build_inverted_index(folder_path, tokenizer, doc_ids=changed), changed)
+        index.commit()
+        print(f"Индекс обновлён: новых {len(added)}, изменённых {len(modified)}, удалённых {len(deleted)}; "
+              f"сегментов {len(index.segments)}, документов {len(index.doc_ids)}")
+    finally:
+        index.close()
+
+
 def main():
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    folder_path = os.path.join(project_root, 'task1', 'выкачка')
-    tokens_file = os.path.join(project_root, 'task2', 'tokens.txt')
-    output_file = os.path.join(project_root, 'task3', 'inverted_index.json')
+    parser = argparse.ArgumentParser(description="Построение инвертированного индекса")
+    parser.add_argument('--json', action='store_true', help="дополнительно сохранить индекс в JSON (для отладки)")
+    parser.add_argument('--update', nargs='?', const=os.path.join(project_root, 'task1', 'changed_docs.json'),
+                        metavar='MANIFEST', help="обновить индекс только по изменённым документам")
+    parser.add_argument('--merge', action='store_true', help="слить все сегменты в основной файл")
+    parser.add_argument('--positions', action='store_true',
+                        help="построить и позиционный индекс (фразы, NEAR/k, близость слов в task5)")
+    args = parser.parse_args()
 
-    tokens = read_tokens(tokens_file)
+    folder_path = os.path.join(project_root, 'task1', 'выкачка')
+    output_file = os.path.join(project_root, 'task3', 'inverted_index.bin')
+    json_file = os.path.join(project_root, 'task3', 'inverted_index.json')
+    positions_file = os.path.join(project_root, 'task3', 'inverted_index.pos')
 
-    inverted_index = build_inverted_index(folder_path, tokens)
+    if args.update or args.merge:
+        if args.update:
+            update_inverted_index(folder_path, output_file, args.update)
+        if args.merge:
+            index = SegmentedIndex(output_file)
+            index.maybe_merge(force=True)
+            index.close()
+        return
 
-    with open(output_file, 'w', encoding='utf-8') as file:
-        json.dump({k: list(v) for k, v in inverted_index.items()}, file, ensure_ascii=False, indent=4)
+    positions = {} if args.positions else None
+    inverted_index = build_inverted_index(folder_path, positions=positions)
 
+    write_binary_index(output_file, inverted_index)
+    # Полная перестройка заменяет и все накопленные сегменты
+    shutil.rmtree(os.path.join(project_root, 'task3', 'segments'), ignore_errors=True)
     print(f"Инвертированный индекс сохранён в файл: {output_file}")
+    if positions is not None:
+        write_positional_index(positions_file, positions)
+        print(f"Позиционный индекс сохранён в файл: {positions_file}")
+    elif os.path.exists(positions_file):
+        os.remove(positions_file)
+
+    if args.json:
+        with open(json_file, 'w', encoding='utf-8') as file:
+            json.dump(inverted_index, file, ensure_ascii=False, indent=4)
+        print(f"JSON-версия индекса сохранена в файл: {json_file}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,93 +1,44 @@
 import os
-import json
+import sys
 
-def boolean_search(query, inverted_index):
-    query = query.lower()
-    tokens = []
-    current_token = ""
-    for char in query:
-        if char in "()":
-            if current_token:
-                tokens.append(current_token.strip())
-                current_token = ""
-            tokens.append(char)
-        elif char in " ":
-            if current_token:
-                tokens.append(current_token.strip())
-                current_token = ""
-        else:
-            current_token += char
-    if current_token:
-        tokens.append(current_token.strip())
-
-    tokens = [token for token in tokens if token]
-
-    def shunting_yard(tokens):
-        output = []
-        operators = []
-        precedence = {"not": 3, "and": 2, "or": 1}
-
-        for token in tokens:
-            if token in precedence:
-                while (operators and operators[-1] != "(" and
-                       precedence.get(operators[-1], 0) >= precedence[token]):
-                    output.append(operators.pop())
-                operators.append(token)
-            elif token == "(":
-                operators.append(token)
-            elif token == ")":
-                while operators[-1] != "(":
-                    output.append(operators.pop())
-                operators.pop()
-            else:
-                output.append(token)
+from binary_index import load_inverted_index
+from positional_index import PositionalIndex
+from query_compiler import BooleanSearcher
 
-        while operators:
-            output.append(operators.pop())
-
-        return output
-
-    def evaluate(rpn):
-        stack = []
-        for token in rpn:
-            if token == "and":
-                right = stack.pop()
-                left = stack.pop()
-                stack.append(left & right)
-            elif token == "or":
-                right = stack.pop()
-                left = stack.pop()
-                stack.append(left | right)
-            elif token == "not":
-                operand = stack.pop()
-                all_docs = set(range(1, 101))
-                stack.append(all_docs - operand)
-            else:
-                stack.append(inverted_index.get(token, set()))
-        return stack.pop()
+def boolean_search(query, inverted_index):
+    # Лучше один раз создать BooleanSearcher и передавать его сюда:
+    # тогда планы запросов и результаты подвыражений кэшируются
+    if isinstance(inverted_index, BooleanSearcher):
+        searcher = inverted_index
+    else:
+        searcher = BooleanSearcher(inverted_index)
 
-    try:
-        rpn = shunting_yard(tokens)
-        result = evaluate(rpn)
-        return sorted(result)
-    except Exception as e:
-        print(f"Ошибка при обработке запроса: {e}")
-        return set()
+    # Ошибки в запросе (ValueError) обрабатывает вызывающий
+    return searcher.search(query)
 
 
 def main():
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    index_file = os.path.join(project_root, 'task3', 'inverted_index.json')
+    sys.path.append(os.path.join(project_root, 'task2'))
+    from tokenizer import load_stop_words
 
-    with open(index_file, 'r', encoding='utf-8') as f:
-        inverted_index = {k: set(v) for k, v in json.load(f).items()}
+    # Позиционный индекс (build_index.py --positions) нужен для "фраз" и NEAR/k
+    positions_file = os.path.join(project_root, 'task3', 'inverted_index.pos')
+    positions = PositionalIndex(positions_file) if os.path.exists(positions_file) else None
+    inverted_index = BooleanSearcher(load_inverted_index(os.path.join(project_root, 'task3', 'inverted_index.bin'),
+                                                         os.path.join(project_root, 'task3', 'inverted_index.json')),
+                                     positions=positions, stop_words=load_stop_words())
 
     while True:
         query = input("Введите запрос (или '-1' для выхода): ").strip()
         if query.lower() == '-1':
             break
 
-        result = boolean_search(query, inverted_index)
+        try:
+            result = boolean_search(query, inverted_index)
+        except ValueError as e:
+            print(f"Ошибка при обработке запроса: {e}")
+            continue
         print(f"Результат поиска: {result}")
 
 
@@ -0,0 +1,340 @@
+import os
+import mmap
+import heapq
+import struct
+from bisect import bisect_right
+
+from binary_index import encode_varint
+
+# Позиционный индекс: для каждого термина - документы и позиции слова в них.
+# Позиция - номер слова в тексте страницы, стоп-слова тоже занимают позицию.
+# Формат файла (little-endian, секции выровнены по 8 байт):
+#   заголовок HEADER (магия, версия, n_terms, n_skips, смещения секций)
+#   doc_freqs     uint32 * n_terms       - число документов термина
+#   term_offsets  uint32 * (n_terms + 1) - границы терминов в terms_blob
+#   block_offsets uint64 * (n_terms + 1) - границы блоков терминов в blocks_blob
+#   skip_offsets  uint64 * (n_terms + 1) - границы указателей пропуска терминов
+#   skip_docs     uint32 * n_skips       - документ, с которого начинается пропуск
+#   skip_bytes    uint32 * n_skips       - смещение этого документа внутри блока
+#   terms_blob    термины в utf-8, отсортированы по байтам
+#   blocks_blob   для каждого документа: varint(номер), varint(длина позиций в байтах),
+#                 varint-разности позиций
+# Номер документа записывается разностью с предыдущим, кроме каждого SKIP_INTERVAL-го:
+# он записан целиком, и на него указывает указатель пропуска, так что чтение можно
+# начать с любого указателя.
+MAGIC = b'OIPPOS\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQQQQQQ')
+SKIP_INTERVAL = 32
+
+
+def _pad(out):
+    out.extend(b'\x00' * (-len(out) % 8))
+
+
+def write_positional_index(path, positions):
+    """Записывает {термин: [(номер документа, [позиции]), ...]} (документы по возрастанию)"""
+    terms = sorted(positions, key=lambda term: term.encode('utf-8'))
+
+    terms_blob = bytearray()
+    term_offsets = [0]
+    blocks_blob = bytearray()
+    block_offsets = [0]
+    skip_offsets = [0]
+    skip_docs = []
+    skip_bytes = []
+    doc_freqs = []
+    for term in terms:
+        terms_blob.extend(term.encode('utf-8'))
+        term_offsets.append(len(terms_blob))
+
+        block_start = len(blocks_blob)
+        previous = 0
+        for i, (doc_id, doc_positions) in enumerate(positions[term]):
+            if i % SKIP_INTERVAL == 0:
+                previous = 0
+                if i:
+                    skip_docs.append(doc_id)
+                    skip_bytes.append(len(blocks_blob) - block_start)
+            encode_varint(doc_id - previous, blocks_blob)
+            previous = doc_id
+
+            encoded = bytearray()
+            last = 0
+            for position in doc_positions:
+                encode_varint(position - last, encoded)
+                last = position
+            encode_varint(len(encoded), blocks_blob)
+            blocks_blob.extend(encoded)
+        block_offsets.append(len(blocks_blob))
+        skip_offsets.append(len(skip_docs))
+        doc_freqs.append(len(positions[term]))
+
+    body = bytearray()
+    offsets = []
+    for fmt, values in (('I', doc_freqs), ('I', term_offsets), ('Q', block_offsets), ('Q', skip_offsets),
+                        ('I', skip_docs), ('I', skip_bytes)):
+        offsets.append(HEADER.size + len(body))
+        body.extend(struct.pack(f'<{len(values)}{fmt}', *values))
+        _pad(body)
+    offsets.append(HEADER.size + len(body))
+    body.extend(terms_blob)
+    _pad(body)
+    offsets.append(HEADER.size + len(body))
+    body.extend(blocks_blob)
+
+    header = HEADER.pack(MAGIC, VERSION, len(terms), len(skip_docs), *offsets)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+def _read_varint(buf, i):
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, i
+        shift += 7
+
+
+class PostingCursor:
+    """Курсор по документам одного термина: doc - текущий документ (None в конце).
+
+    advance(target) сначала галопом идёт по указателям пропуска (шаг 1, 2, 4, ...,
+    затем двоичный поиск), и только последние не больше SKIP_INTERVAL документов
+    читает подряд. Позиции документа декодируются, только если их спросили.
+    """
+
+    def __init__(self, buf, start, end, skip_docs, skip_bytes, doc_freq):
+        self._buf = buf
+        self._start = start
+        self._end = end
+        self._skip_docs = skip_docs
+        self._skip_bytes = skip_bytes
+        self.doc_freq = doc_freq
+        self._skip = 0  # первый указатель пропуска, который ещё впереди
+        self._ordinal = -1
+        self._next = start
+        self.doc = None
+        self._read()
+
+    def _read(self):
+        if self._next >= self._end:
+            self.doc = None
+            return
+        self._ordinal += 1
+        delta, i = _read_varint(self._buf, self._next)
+        self.doc = delta if self._ordinal % SKIP_INTERVAL == 0 else self.doc + delta
+        length, self._positions_start = _read_varint(self._buf, i)
+        self._next = self._positions_start + length
+
+    def next(self):
+        if self.doc is not None:
+            self._read()
+        return self.doc
+
+    def advance(self, target):
+        """Переходит к первому документу >= target"""
+        if self.doc is None or self.doc >= target:
+            return self.doc
+
+        skip_docs = self._skip_docs
+        n_skips = len(skip_docs)
+        lo = self._skip
+        if lo < n_skips and skip_docs[lo] <= target:
+            # Галоп: ищем границу, за которой указатели уже дальше target
+            step = 1
+            hi = lo + 1
+            while hi < n_skips and skip_docs[hi] <= target:
+                lo = hi
+                step *= 2
+                hi = lo + step
+            hi = min(hi, n_skips)
+            lo = bisect_right(skip_docs, target, lo, hi) - 1
+            self._skip = lo + 1
+            # Указатель может оказаться позади курсора, если до него дочитали подряд
+            if skip_docs[lo] > self.doc:
+                self._ordinal = (lo + 1) * SKIP_INTERVAL - 1
+                self._next = self._start + self._skip_bytes[lo]
+                self._read()
+
+        while self.doc is not None and self.doc < target:
+            self._read()
+        return self.doc
+
+    def positions(self):
+        """Позиции термина в текущем документе"""
+        result = []
+        position = 0
+        i = self._positions_start
+        while i < self._next:
+            delta, i = _read_varint(self._buf, i)
+            position += delta
+            result.append(position)
+        return result
+
+
+def intersect(cursors):
+    """Документы, которые есть у всех курсоров (пересечение "чехардой": самый редкий
+    список задаёт кандидата, остальные догоняют его через advance)"""
+    if not cursors:
+        return
+    cursors = sorted(cursors, key=lambda cursor: cursor.doc_freq)
+    candidate = cursors[0].doc
+    while candidate is not None:
+        for cursor in cursors:
+            doc = cursor.advance(candidate)
+            if doc is None:
+                return
+            if doc != candidate:
+                candidate = doc
+                break
+        else:
+            yield candidate
+            candidate = cursors[0].advance(candidate + 1)
+
+
+def phrase_match(position_lists, offsets):
+    """Есть ли позиция p, при которой слово i стоит на p + offsets[i]"""
+    starts = None
+    for positions, offset in sorted(zip(position_lists, offsets), key=lambda item: len(item[0])):
+        shifted = {position - offset for position in positions}
+        starts = shifted if starts is None else starts & shifted
+        if not starts:
+            return False
+    return True
+
+
+def min_distance(left, right):
+    """Наименьшее расстояние между позициями двух отсортированных списков"""
+    i = j = 0
+    best = None
+    while i < len(left) and j < len(right):
+        distance = abs(left[i] - right[j])
+        if best is None or distance < best:
+            best = distance
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return best
+
+
+def min_window(position_lists):
+    """Длина наименьшего окна (последняя позиция - первая), в котором есть позиция из каждого списка"""
+    heap = [(positions[0], k, 0) for k, positions in enumerate(position_lists)]
+    heapq.heapify(heap)
+    right = max(position for position, _, _ in heap)
+    best = right - heap[0][0]
+    while True:
+        position, k, i = heapq.heappop(heap)
+        best = min(best, right - position)
+        if i + 1 == len(position_lists[k]):
+            return best
+        following = position_lists[k][i + 1]
+        right = max(right, following)
+        heapq.heappush(heap, (following, k, i + 1))
+
+
+class PositionalIndex:
+    """Позиционный индекс, открытый через mmap (см. формат выше)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        (magic, version, n_terms, n_skips,
+         freqs_off, term_offsets_off, block_offsets_off, skip_offsets_off,
+         skip_docs_off, skip_bytes_off, terms_off, blocks_off) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не позиционный индекс или неподдерживаемая версия")
+
+        self.n_terms = n_terms
+        self._doc_freqs = buf[freqs_off:freqs_off + 4 * n_terms].cast('I')
+        self._term_offsets = buf[term_offsets_off:term_offsets_off + 4 * (n_terms + 1)].cast('I')
+        self._block_offsets = buf[block_offsets_off:block_offsets_off + 8 * (n_terms + 1)].cast('Q')
+        self._skip_offsets = buf[skip_offsets_off:skip_offsets_off + 8 * (n_terms + 1)].cast('Q')
+        self._skip_docs = buf[skip_docs_off:skip_docs_off + 4 * n_skips].cast('I')
+        self._skip_bytes = buf[skip_bytes_off:skip_bytes_off + 4 * n_skips].cast('I')
+        self._terms = buf[terms_off:blocks_off]
+        self._blocks = buf[blocks_off:]
+        self._buf = buf
+
+    def close(self):
+        for view in (self._doc_freqs, self._term_offsets, self._block_offsets, self._skip_offsets,
+                     self._skip_docs, self._skip_bytes, self._terms, self._blocks, self._buf):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _term_at(self, i):
+        return bytes(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _find(self, term):
+        key = term.encode('utf-8')
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._term_at(lo) == key:
+            return lo
+        return None
+
+    def __len__(self):
+        return self.n_terms
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def doc_freq(self, term):
+        i = self._find(term)
+        return self._doc_freqs[i] if i is not None else 0
+
+    def cursor(self, term):
+        """Курсор по документам термина или None, если термина нет"""
+        i = self._find(term)
+        if i is None:
+            return None
+        skips = slice(self._skip_offsets[i], self._skip_offsets[i + 1])
+        return PostingCursor(self._blocks, self._block_offsets[i], self._block_offsets[i + 1],
+                             self._skip_docs[skips], self._skip_bytes[skips], self._doc_freqs[i])
+
+    def positions(self, term, doc_id):
+        """Позиции термина в документе ([] - термина в документе нет)"""
+        cursor = self.cursor(term)
+        if cursor is None or cursor.advance(doc_id) != doc_id:
+            return []
+        return cursor.positions()
+
+    def phrase(self, words):
+        """Документы с фразой; words - [(смещение слова во фразе, термин)]"""
+        cursors = [self.cursor(term) for _, term in words]
+        if any(cursor is None for cursor in cursors):
+            return []
+        offsets = [offset for offset, _ in words]
+        return [doc_id for doc_id in intersect(cursors)
+                if phrase_match([cursor.positions() for cursor in cursors], offsets)]
+
+    def near(self, left, right, distance):
+        """Документы, где термины стоят не дальше distance слов друг от друга (в любом порядке)"""
+        cursors = [self.cursor(left), self.cursor(right)]
+        if any(cursor is None for cursor in cursors):
+            return []
+        return [doc_id for doc_id in intersect(cursors)
+                if min_distance(cursors[0].positions(), cursors[1].positions()) <= distance]
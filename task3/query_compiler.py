@@ -0,0 +1,272 @@
+import re
+from collections import OrderedDict
+
+from bitmap_index import BitmapIndex, from_bitmap, to_bitmap
+
+# "фраза в кавычках", скобки или слово/оператор
+QUERY_TOKEN_RE = re.compile(r'"[^"]*"?|[()]|[^ ()"]+')
+NEAR_RE = re.compile(r'^near/(\d+)$')
+PRECEDENCE = {"not": 3, "and": 2, "or": 1}
+# a NEAR/k b связывает сильнее всех остальных операторов
+NEAR_PRECEDENCE = 4
+EMPTY = ("empty",)
+
+
+def tokenize_query(query):
+    tokens = (token.strip() for token in QUERY_TOKEN_RE.findall(query.lower()))
+    return [token for token in tokens if token]
+
+
+def precedence(token):
+    if NEAR_RE.match(token):
+        return NEAR_PRECEDENCE
+    return PRECEDENCE.get(token)
+
+
+def parse_phrase(token, stop_words=frozenset()):
+    """"слова фразы" -> ("phrase", ((смещение, слово), ...)); стоп-слова пропускаются,
+    но место занимают - так же, как при построении позиционного индекса"""
+    words = [(offset, word) for offset, word in enumerate(token.strip('"').split()) if word not in stop_words]
+    if not words:
+        return EMPTY
+    if len(words) == 1:
+        return ("term", words[0][1])
+    first = words[0][0]
+    return ("phrase", tuple((offset - first, word) for offset, word in words))
+
+
+def node_terms(node):
+    """Слова позиционного узла (фразы или NEAR)"""
+    if node[0] == "phrase":
+        return [term for _, term in node[1]]
+    return [node[1], node[2]]
+
+
+def shunting_yard(tokens):
+    output = []
+    operators = []
+
+    for token in tokens:
+        if token == "not":
+            # Унарный NOT правоассоциативен: в NOT NOT x внешний NOT применяется
+            # к результату внутреннего, поэтому ничего со стека не снимаем
+            operators.append(token)
+        elif precedence(token) is not None:
+            while (operators and operators[-1] != "(" and
+                   (precedence(operators[-1]) or 0) >= precedence(token)):
+                output.append(operators.pop())
+            operators.append(token)
+        elif token == "(":
+            operators.append(token)
+        elif token == ")":
+            while operators and operators[-1] != "(":
+                output.append(operators.pop())
+            if not operators:
+                raise ValueError("лишняя закрывающая скобка в запросе")
+            operators.pop()
+        else:
+            output.append(token)
+
+    while operators:
+        if operators[-1] == "(":
+            raise ValueError("незакрытая скобка в запросе")
+        output.append(operators.pop())
+
+    return output
+
+
+def parse(tokens, stop_words=frozenset()):
+    """Токены запроса -> дерево из кортежей ("term", t) / ("not", x) / ("and"|"or", [...]) /
+    ("phrase", ((смещение, t), ...)) / ("near", t1, t2, k)"""
+    stack = []
+
+    def pop(operator):
+        if not stack:
+            raise ValueError(f"не хватает операнда для {operator.upper()}" if operator else "пустой запрос")
+        return stack.pop()
+
+    for token in shunting_yard(tokens):
+        near = NEAR_RE.match(token)
+        if token in ("and", "or"):
+            right = pop(token)
+            left = pop(token)
+            stack.append((token, [left, right]))
+        elif token == "not":
+            stack.append(("not", pop(token)))
+        elif near:
+            right = pop(token)
+            left = pop(token)
+            if left[0] != "term" or right[0] != "term":
+                raise ValueError("NEAR/k связывает только два слова")
+            stack.append(("near", left[1], right[1], int(near.group(1))))
+        elif token.startswith('"'):
+            stack.append(parse_phrase(token, stop_words))
+        else:
+            stack.append(("term", token))
+    return pop(None)
+
+
+def optimize(node, index):
+    """Переписывает дерево запроса в план выполнения.
+
+    - NOT NOT x -> x;
+    - вложенные AND/OR склеиваются в один узел;
+    - a AND NOT b -> ("andnot", [a], [b]), т.е. разность множеств без дополнения;
+    - NOT a AND NOT b -> NOT (a OR b);
+    - операнды сортируются по длине списков (AND - от коротких),
+      поэтому одинаковые подвыражения дают одинаковые узлы и делят кэш.
+    Узлы плана неизменяемые (кортежи), чтобы служить ключами кэша.
+    """
+    kind = node[0]
+    if kind in ("term", "empty"):
+        return node
+    if kind in ("phrase", "near"):
+        # Фраза или NEAR со словом, которого нет в индексе, ничего не найдут
+        if any(index.doc_freq(term) == 0 for term in node_terms(node)):
+            return EMPTY
+        return node
+
+    if kind == "not":
+        child = optimize(node[1], index)
+        if child[0] == "not":
+            return child[1]
+        return ("not", child)
+
+    children = []
+    for child in node[1]:
+        child = optimize(child, index)
+        if child[0] == kind:
+            children.extend(child[1])
+        else:
+            children.append(child)
+
+    if kind == "or":
+        children = [child for child in children if child != EMPTY]
+        if not children:
+            return EMPTY
+        children = sorted(set(children), key=repr)
+        return children[0] if len(children) == 1 else ("or", tuple(children))
+
+    if EMPTY in children:
+        return EMPTY
+    positives = sorted(set(child for child in children if child[0] != "not"),
+                       key=lambda child: (estimate(child, index), repr(child)))
+    negatives = sorted(set(child[1] for child in children if child[0] == "not"), key=repr)
+
+    # Термин, которого нет в индексе, обнуляет всё пересечение
+    if any(child[0] == "term" and index.doc_freq(child[1]) == 0 for child in positives):
+        return EMPTY
+    if not positives:
+        excluded = negatives[0] if len(negatives) == 1 else ("or", tuple(negatives))
+        return ("not", excluded)
+    if negatives:
+        return ("andnot", tuple(positives), tuple(negatives))
+    return positives[0] if len(positives) == 1 else ("and", tuple(positives))
+
+
+def estimate(node, index):
+    """Оценка числа документов в результате узла"""
+    kind = node[0]
+    if kind == "term":
+        return index.doc_freq(node[1])
+    if kind == "empty":
+        return 0
+    if kind in ("phrase", "near"):
+        return min(index.doc_freq(term) for term in node_terms(node))
+    if kind == "not":
+        return max(index.live_count - estimate(node[1], index), 0)
+    if kind in ("and", "andnot"):
+        return min(estimate(child, index) for child in node[1])
+    return sum(estimate(child, index) for child in node[1])
+
+
+class BooleanSearcher:
+    """Булев поиск со скомпилированными планами.
+
+    Планы запросов лежат в LRU по нормализованному запросу, результаты
+    составных подвыражений - в отдельном LRU. Оба кэша сбрасываются,
+    когда меняется версия индекса (BitmapIndex.version).
+
+    Фразы ("немецкая овчарка") и a NEAR/k b проверяются по позиционному
+    индексу positions (PositionalIndex); stop_words - стоп-слова, которые
+    выброшены из него при построении.
+    """
+
+    def __init__(self, index, plan_cache_size=1024, result_cache_size=4096, positions=None,
+                 stop_words=frozenset()):
+        self.index = index if isinstance(index, BitmapIndex) else BitmapIndex(index)
+        self.positions = positions
+        self.stop_words = frozenset(stop_words)
+        self.plan_cache_size = plan_cache_size
+        self.result_cache_size = result_cache_size
+        self._plans = OrderedDict()
+        self._results = OrderedDict()
+        self._version = self.index.version
+
+    def _check_version(self):
+        if self._version != self.index.version:
+            self._plans.clear()
+            self._results.clear()
+            self._version = self.index.version
+
+    def compile(self, query):
+        self._check_version()
+        tokens = tokenize_query(query)
+        key = " ".join(tokens)
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+            return plan
+
+        plan = optimize(parse(tokens, self.stop_words), self.index)
+        self._plans[key] = plan
+        if len(self._plans) > self.plan_cache_size:
+            self._plans.popitem(last=False)
+        return plan
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == "term":
+            return self.index.term(node[1])
+        if kind == "empty":
+            return 0
+
+        bits = self._results.get(node)
+        if bits is not None:
+            self._results.move_to_end(node)
+            return bits
+
+        if kind in ("phrase", "near"):
+            if self.positions is None:
+                raise ValueError("для фраз и NEAR/k нужен позиционный индекс: build_index.py --positions")
+            if kind == "phrase":
+                doc_ids = self.positions.phrase(node[1])
+            else:
+                doc_ids = self.positions.near(node[1], node[2], node[3])
+            bits = to_bitmap(doc_ids) & self.index.live_docs
+        elif kind == "not":
+            bits = self.index.complement(self.evaluate(node[1]))
+        elif kind == "or":
+            bits = 0
+            for child in node[1]:
+                bits |= self.evaluate(child)
+        else:
+            # AND / AND-NOT: операнды уже упорядочены от коротких к длинным
+            bits = self.evaluate(node[1][0])
+            for child in node[1][1:]:
+                if not bits:
+                    break
+                bits &= self.evaluate(child)
+            if kind == "andnot":
+                for child in node[2]:
+                    if not bits:
+                        break
+                    bits &= ~self.evaluate(child)
+
+        self._results[node] = bits
+        if len(self._results) > self.result_cache_size:
+            self._results.popitem(last=False)
+        return bits
+
+    def search(self, query):
+        return from_bitmap(self.evaluate(self.compile(query)))
@@ -0,0 +1,205 @@
+import os
+import json
+import heapq
+
+from binary_index import BinaryInvertedIndex, write_binary_index
+
+# Сколько дополнительных сегментов допускаем, прежде чем слить их в один
+MAX_SEGMENTS = 8
+# При какой доле удалённых документов основной индекс переписывается целиком
+MAX_DELETED_RATIO = 0.25
+
+
+class SegmentedIndex:
+    """Инвертированный индекс из основного файла и дополнительных сегментов.
+
+    Как в Lucene: изменённые и новые документы записываются в новый
+    небольшой сегмент, а их старые версии и удалённые документы помечаются
+    надгробиями (tombstones) в своих сегментах. Со временем сегменты
+    сливаются, и надгробия при этом выбрасываются.
+
+    Снаружи выглядит так же, как BinaryInvertedIndex: get(), doc_freq(), doc_ids.
+    Список сегментов и надгробия хранятся в segments/segments.json рядом
+    с основным файлом.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.segments_dir = os.path.join(os.path.dirname(base_path), 'segments')
+        self.manifest_path = os.path.join(self.segments_dir, 'segments.json')
+
+        manifest = {'generation': 0, 'segments': [], 'tombstones': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        self.generation = manifest['generation']
+        self.tombstones = {name: set(doc_ids) for name, doc_ids in manifest['tombstones'].items()}
+        self.base = None
+        self.extra = []
+        self._open(manifest['segments'])
+
+    @property
+    def base_name(self):
+        return os.path.basename(self.base_path)
+
+    @property
+    def segments(self):
+        """Все сегменты в порядке создания: основной файл, затем дополнительные"""
+        base = [(self.base_name, self.base)] if self.base is not None else []
+        return base + self.extra
+
+    def _open(self, names):
+        if os.path.exists(self.base_path):
+            self.base = BinaryInvertedIndex(self.base_path)
+        self.extra = [(name, BinaryInvertedIndex(os.path.join(self.segments_dir, name))) for name in names]
+        self._refresh_doc_ids()
+
+    def _refresh_doc_ids(self):
+        live = set()
+        for name, segment in self.segments:
+            live.update(set(segment.doc_ids) - self.tombstones.get(name, set()))
+        self.doc_ids = sorted(live)
+
+    def close(self):
+        for _, segment in self.segments:
+            segment.close()
+        self.base = None
+        self.extra = []
+
+    def _save_manifest(self):
+        os.makedirs(self.segments_dir, exist_ok=True)
+        manifest = {
+            'generation': self.generation,
+            'segments': [name for name, _ in self.extra],
+            'tombstones': {name: sorted(doc_ids) for name, doc_ids in self.tombstones.items() if doc_ids},
+        }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    # Чтение
+
+    def get(self, term, default=None):
+        lists = []
+        for name, segment in self.segments:
+            postings = segment.get(term)
+            if postings:
+                dead = self.tombstones.get(name)
+                if dead:
+                    postings = [doc_id for doc_id in postings if doc_id not in dead]
+                lists.append(postings)
+        if not any(lists):
+            return default
+        # Живые документы сегментов не пересекаются, достаточно слить списки
+        return list(heapq.merge(*lists)) if len(lists) > 1 else lists[0]
+
+    def __getitem__(self, term):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def doc_freq(self, term):
+        return len(self.get(term, ()))
+
+    def __iter__(self):
+        seen = set()
+        for _, segment in self.segments:
+            for term in segment:
+                if term not in seen:
+                    seen.add(term)
+                    if term in self:
+                        yield term
+
+    def keys(self):
+        return iter(self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        for term in self:
+            yield term, self[term]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    # Изменения
+
+    def delete(self, doc_ids):
+        """Помечает надгробиями текущие версии документов"""
+        doc_ids = set(doc_ids)
+        for name, segment in self.segments:
+            present = doc_ids.intersection(segment.doc_ids)
+            if present:
+                self.tombstones.setdefault(name, set()).update(present)
+        self._refresh_doc_ids()
+
+    def add_segment(self, inverted_index, doc_ids):
+        """Записывает новые версии документов отдельным сегментом"""
+        if not doc_ids:
+            return
+        self.generation += 1
+        name = f'seg_{self.generation}.bin'
+        os.makedirs(self.segments_dir, exist_ok=True)
+        path = os.path.join(self.segments_dir, name)
+        write_binary_index(path, inverted_index, doc_ids)
+        self.extra.append((name, BinaryInvertedIndex(path)))
+        self._refresh_doc_ids()
+
+    def commit(self):
+        self.maybe_merge()
+        self._save_manifest()
+
+    def deleted_count(self):
+        return sum(len(doc_ids) for doc_ids in self.tombstones.values())
+
+    def maybe_merge(self, force=False):
+        """Сливает сегменты, когда их стало много или накопилось много надгробий"""
+        if force or self.deleted_count() > MAX_DELETED_RATIO * max(len(self.doc_ids), 1):
+            self.merge_all()
+        elif len(self.extra) > MAX_SEGMENTS:
+            self.merge_extra()
+
+    def _live_postings(self, segments):
+        merged = {}
+        for name, segment in segments:
+            dead = self.tombstones.get(name, set())
+            for term, postings in segment.items():
+                live = [doc_id for doc_id in postings if doc_id not in dead]
+                if live:
+                    merged.setdefault(term, []).extend(live)
+        doc_ids = set()
+        for name, segment in segments:
+            doc_ids.update(set(segment.doc_ids) - self.tombstones.get(name, set()))
+        return merged, doc_ids
+
+    def merge_extra(self):
+        """Сливает все дополнительные сегменты в один, основной файл не трогаем"""
+        merged, doc_ids = self._live_postings(self.extra)
+        old_names = [name for name, _ in self.extra]
+        for _, segment in self.extra:
+            segment.close()
+        self.extra = []
+        for name in old_names:
+            self.tombstones.pop(name, None)
+        self.add_segment(merged, doc_ids)
+        self._save_manifest()
+        for name in old_names:
+            os.remove(os.path.join(self.segments_dir, name))
+
+    def merge_all(self):
+        """Переписывает основной файл со всеми живыми документами и удаляет сегменты"""
+        merged, doc_ids = self._live_postings(self.segments)
+        old_names = [name for name, _ in self.extra]
+        self.close()
+        write_binary_index(self.base_path, merged, doc_ids)
+        self.tombstones = {}
+        self._open([])
+        self._save_manifest()
+        for name in old_names:
+            os.remove(os.path.join(self.segments_dir, name))
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from collections import defaultdict
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'task2'))
+sys.path.append(os.path.join(project_root, 'task3'))
+
+from tokenizer import Tokenizer
+from extract import TextCache, page_text
+from pages import list_pages
+from binary_index import write_binary_index
+from tfidf import TermCounter, save_counter, docs_folder, lemma_cache_file, tfidf_file
+
+index_file = os.path.join(project_root, 'task3', 'inverted_index.bin')
+index_json_file = os.path.join(project_root, 'task3', 'inverted_index.json')
+
+
+# Этапы конвейера - генераторы, документ проходит их все по одному,
+# поэтому в памяти одновременно лежит только текущая страница
+
+def read_pages(folder, text_cache=None):
+    """(doc_id, извлечённый текст) для каждой страницы по возрастанию номера"""
+    for doc_id, path in list_pages(folder):
+        yield doc_id, page_text(path, text_cache)
+
+
+def tokenize(pages, tokenizer):
+    """(doc_id, слова страницы с повторами)"""
+    for doc_id, text in pages:
+        yield doc_id, list(tokenizer.iter_tokens(text))
+
+
+def lemmatize(docs, tokenizer):
+    """(doc_id, слова, {токен: лемма}) - леммы для уникальных токенов через общий кэш"""
+    for doc_id, words in docs:
+        yield doc_id, words, {token: tokenizer.lemmatize(token) for token in dict.fromkeys(words)}
+
+
+# Накопители: каждый получает документы по очереди, а в finish() пишет свой результат
+
+class PostingsSink:
+    """Списки словопозиций для task3 (документы приходят по возрастанию, списки сразу отсортированы)"""
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.index = defaultdict(list)
+        self.doc_ids = []
+
+    def add(self, doc_id, words, lemmas):
+        self.doc_ids.append(doc_id)
+        # Ключи lemmas - уникальные токены документа в порядке появления
+        for token in lemmas:
+            self.index[token].append(doc_id)
+
+    def finish(self):
+        write_binary_index(self.path, self.index, self.doc_ids)
+        # Полная перестройка заменяет и все накопленные сегменты
+        shutil.rmtree(os.path.join(os.path.dirname(self.path), 'segments'), ignore_errors=True)
+        # Позиционный индекс этим конвейером не строится, старый больше не соответствует индексу
+        positions_path = os.path.splitext(self.path)[0] + '.pos'
+        if os.path.exists(positions_path):
+            os.remove(positions_path)
+        if self.json_path:
+            with open(self.json_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=4)
+        return f"индекс: {len(self.index)} терминов"
+
+
+class TfIdfSink:
+    """Количества токенов и лемм для task4"""
+
+    def __init__(self, path, tokenizer):
+        self.path = path
+        self.counter = TermCounter(tokenizer)
+
+    def add(self, doc_id, words, lemmas):
+        self.counter.add(doc_id, words)
+
+    def finish(self):
+        save_counter(self.path, self.counter)
+        return f"TF-IDF: токенов {len(self.counter.tokens)}, лемм {len(self.counter.lemmas)}"
+
+
+class TextExportSink:
+    """Отладочная выгрузка в формате task2: page_N_tokens.txt, page_N_lemmas.txt
+    и общие tokens.txt / lemmatized_tokens.txt"""
+
+    def __init__(self, task2_dir):
+        self.task2_dir = task2_dir
+        self.tokens_dir = os.path.join(task2_dir, 'tokens')
+        self.lemmas_dir = os.path.join(task2_dir, 'lemmas')
+        os.makedirs(self.tokens_dir, exist_ok=True)
+        os.makedirs(self.lemmas_dir, exist_ok=True)
+        self.all_lemmas = defaultdict(set)
+
+    def add(self, doc_id, words, lemmas):
+        with open(os.path.join(self.tokens_dir, f'page_{doc_id}_tokens.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lemmas))
+
+        lemmatized = defaultdict(list)
+        for token, lemma in lemmas.items():
+            lemmatized[lemma].append(token)
+            self.all_lemmas[lemma].add(token)
+        with open(os.path.join(self.lemmas_dir, f'page_{doc_id}_lemmas.txt'), 'w', encoding='utf-8') as f:
+            for lemma, forms in lemmatized.items():
+                f.write(f"{lemma}: {' '.join(forms)}\n")
+
+    def finish(self):
+        all_tokens = set().union(*self.all_lemmas.values())
+        with open(os.path.join(self.task2_dir, 'tokens.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(sorted(all_tokens)))
+        with open(os.path.join(self.task2_dir, 'lemmatized_tokens.txt'), 'w', encoding='utf-8') as f:
+            for lemma in sorted(self.all_lemmas):
+                f.write(f"{lemma}: {' '.join(sorted(self.all_lemmas[lemma]))}\n")
+        return f"файлы task2: {len(all_tokens)} токенов"
+
+
+def run_pipeline(folder, sinks, tokenizer, text_cache=None):
+    """Один проход по коллекции: каждая страница читается и разбирается один раз"""
+    start = time.perf_counter()
+    count = 0
+    for doc in lemmatize(tokenize(read_pages(folder, text_cache), tokenizer), tokenizer):
+        for sink in sinks:
+            sink.add(*doc)
+        count += 1
+
+    reports = [sink.finish() for sink in sinks]
+    elapsed = time.perf_counter() - start
+    print(f"Обработано {count} документов за {elapsed:.2f} с ({count / max(elapsed, 1e-9):.1f} док/с); "
+          + "; ".join(reports))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полная перестройка индекса и TF-IDF за один проход по страницам")
+    parser.add_argument('--json', action='store_true', help="дополнительно сохранить индекс в JSON (для отладки)")
+    parser.add_argument('--export-text', action='store_true',
+                        help="выгрузить файлы токенов и лемм task2 (для отладки)")
+    args = parser.parse_args()
+
+    tokenizer = Tokenizer(cache_file=lemma_cache_file)
+    sinks = [PostingsSink(index_file, index_json_file if args.json else None), TfIdfSink(tfidf_file, tokenizer)]
+    if args.export_text:
+        sinks.append(TextExportSink(os.path.join(project_root, 'task2')))
+
+    run_pipeline(docs_folder, sinks, tokenizer, TextCache())
+    tokenizer.save_cache()
+
+
+if __name__ == "__main__":
+    main()
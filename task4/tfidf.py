@@ -1,127 +1,226 @@
 import os
-import math
-from collections import defaultdict
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from scipy import sparse
 
 # Пути к файлам
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 docs_folder = os.path.join(project_root, 'task1', 'выкачка')
-tokens_folder = os.path.join(project_root, 'task2', 'tokens')
-lemmas_folder = os.path.join(project_root, 'task2', 'lemmas')
-
-# Создаем папки для результатов
-output_tokens = os.path.join(project_root, 'task4', 'tfidf_tokens')
-output_lemmas = os.path.join(project_root, 'task4', 'tfidf_lemmas')
-os.makedirs(output_tokens, exist_ok=True)
-os.makedirs(output_lemmas, exist_ok=True)
-
-
-def load_tokens(filename):
-    """Загрузка токенов из файла"""
-    with open(filename, 'r', encoding='utf-8') as f:
-        return [line.strip() for line in f]
+lemma_cache_file = os.path.join(project_root, 'task2', 'lemma_cache.txt')
+
+# Все результаты - одна матрица (вместо файлов tfidf_tokens_N.txt / tfidf_lemmas_N.txt)
+tfidf_file = os.path.join(project_root, 'task4', 'tfidf.npz')
+
+sys.path.append(os.path.join(project_root, 'task2'))
+
+from tokenizer import Tokenizer
+from extract import TextCache, page_text
+from pages import list_pages, find_page
+
+
+class Vocabulary:
+    """Словарь "термин -> номер столбца", номера выдаются по порядку появления"""
+
+    def __init__(self, terms=()):
+        self.ids = {}
+        self.terms = []
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def __len__(self):
+        return len(self.terms)
+
+
+class TermCounter:
+    """Копит количества токенов по документам, документ за документом.
+
+    Токены берутся из сырого потока слов страницы (с повторами), поэтому
+    TF - настоящая частота, а не 1/len как у дедуплицированных файлов task2.
+    На каждый документ хранятся только его уникальные токены и их количества.
+    """
+
+    def __init__(self, tokenizer, tokens=None, lemmas=None, lemma_of_token=None):
+        self.tokenizer = tokenizer
+        self.tokens = tokens or Vocabulary()
+        self.lemmas = lemmas or Vocabulary()
+        self.lemma_of_token = lemma_of_token if lemma_of_token is not None else []
+        self.doc_ids = []
+        self.cols = []
+        self.counts = []
+
+    def add(self, doc_id, words):
+        ids = np.fromiter((self.tokens.add(word) for word in words), dtype=np.int64)
+        for token in self.tokens.terms[len(self.lemma_of_token):]:
+            self.lemma_of_token.append(self.lemmas.add(self.tokenizer.lemmatize(token)))
+        cols, counts = np.unique(ids, return_counts=True)
+        self.doc_ids.append(doc_id)
+        self.cols.append(cols)
+        self.counts.append(counts)
+
+    def matrix(self):
+        """Матрица документ-токен с количествами, строки - в порядке add()"""
+        lengths = [len(cols) for cols in self.cols]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        cols = np.concatenate(self.cols) if self.cols else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate(self.counts).astype(np.float64) if self.counts else np.zeros(0)
+        return sparse.csr_matrix((counts, cols, indptr), shape=(len(self.doc_ids), len(self.tokens)))
+
+
+def count_terms(doc_ids, counter, text_cache=None):
+    """Токенизирует страницы doc_ids и добавляет их в counter"""
+    text_cache = text_cache or TextCache()
+    for doc_id in doc_ids:
+        path = find_page(docs_folder, doc_id)
+        text = page_text(path, text_cache) if path is not None else ''
+        counter.add(doc_id, counter.tokenizer.iter_tokens(text))
+    return counter.matrix()
+
+
+def lemma_projection(lemma_of_token, n_lemmas):
+    """Матрица "токен -> лемма": умножение на неё суммирует количества форм одной леммы"""
+    n_tokens = len(lemma_of_token)
+    return sparse.csr_matrix((np.ones(n_tokens), (np.arange(n_tokens), np.asarray(lemma_of_token, dtype=np.int64))),
+                             shape=(n_tokens, n_lemmas))
+
+
+def compute_tf_idf(counts):
+    """TF, IDF и TF-IDF для матрицы количеств, всё - операциями над разреженными матрицами"""
+    counts = sparse.csr_matrix(counts)
+    total_docs = counts.shape[0]
+
+    doc_lengths = np.asarray(counts.sum(axis=1)).ravel()
+    inv_lengths = np.zeros_like(doc_lengths)
+    inv_lengths[doc_lengths > 0] = 1.0 / doc_lengths[doc_lengths > 0]
+    tf = sparse.diags(inv_lengths) @ counts
+
+    doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.zeros(counts.shape[1])
+    present = doc_freq > 0
+    idf[present] = np.log(total_docs / (doc_freq[present] + 1))
+
+    tfidf = sparse.csr_matrix(tf @ sparse.diags(idf))
+    tfidf.eliminate_zeros()
+    return idf, tfidf
+
+
+def save_tfidf(path, doc_ids, token_terms, lemma_terms, lemma_of_token, token_counts):
+    lemma_counts = sparse.csr_matrix(token_counts @ lemma_projection(lemma_of_token, len(lemma_terms)))
+    token_idf, token_tfidf = compute_tf_idf(token_counts)
+    lemma_idf, lemma_tfidf = compute_tf_idf(lemma_counts)
+
+    arrays = {
+        'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+        'tokens': np.array(token_terms, dtype=str),
+        'lemmas': np.array(lemma_terms, dtype=str),
+        'lemma_of_token': np.asarray(lemma_of_token, dtype=np.int64),
+        'token_idf': token_idf,
+        'lemma_idf': lemma_idf,
+    }
+    for name, matrix in (('token_counts', token_counts), ('token_tfidf', token_tfidf),
+                         ('lemma_tfidf', lemma_tfidf)):
+        arrays[f'{name}_data'] = matrix.data
+        arrays[f'{name}_indices'] = matrix.indices
+        arrays[f'{name}_indptr'] = matrix.indptr
+
+    # Пишем во временный файл и подменяем, чтобы читатели не увидели половину
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def save_counter(path, counter):
+    """Сохраняет TF-IDF по накопленным количествам, строки упорядочиваются по doc_id"""
+    order = np.argsort(counter.doc_ids, kind='stable')
+    token_counts = counter.matrix()[order]
+    save_tfidf(path, np.asarray(counter.doc_ids, dtype=np.int64)[order], counter.tokens.terms,
+               counter.lemmas.terms, counter.lemma_of_token, token_counts)
+
+
+def load_tfidf(path=tfidf_file):
+    """Загружает результат в словарь: doc_ids, tokens, lemmas, idf и матрицы CSR
+    (token_counts, token_tfidf, lemma_tfidf), строки - документы в порядке doc_ids"""
+    with np.load(path) as arrays:
+        result = {name: arrays[name] for name in ('doc_ids', 'tokens', 'lemmas', 'lemma_of_token',
+                                                  'token_idf', 'lemma_idf')}
+        shapes = {'token_counts': len(result['tokens']), 'token_tfidf': len(result['tokens']),
+                  'lemma_tfidf': len(result['lemmas'])}
+        for name, n_cols in shapes.items():
+            result[name] = sparse.csr_matrix(
+                (arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                shape=(len(result['doc_ids']), n_cols))
+    return result
+
+
+def calculate_tf_idf(tokenizer=None):
+    """Основная функция для расчета TF-IDF"""
+    tokenizer = tokenizer or Tokenizer(cache_file=lemma_cache_file)
+    start = time.perf_counter()
 
+    doc_ids = [doc_id for doc_id, _ in list_pages(docs_folder)]
+    counter = TermCounter(tokenizer)
+    count_terms(doc_ids, counter)
+    save_counter(tfidf_file, counter)
+    tokenizer.save_cache()
 
-def load_lemmas(filename):
-    """Загрузка лемм из файла"""
-    lemmas = {}
-    with open(filename, 'r', encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split(': ')
-            if len(parts) == 2:
-                lemma, forms = parts
-                lemmas[lemma] = forms.split()
-    return lemmas
+    print(f"TF-IDF посчитан для {len(doc_ids)} документов за {time.perf_counter() - start:.2f} с: "
+          f"токенов {len(counter.tokens)}, лемм {len(counter.lemmas)}")
 
 
-def count_doc_frequencies(folder):
-    """Подсчет частоты документов, содержащих термин/лемму"""
-    doc_freq = defaultdict(int)
+def update_tf_idf(manifest_file, tokenizer=None):
+    """Пересчитывает TF-IDF после обхода по списку изменённых документов.
 
-    for filename in os.listdir(folder):
-        if filename.endswith('.txt'):
-            with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
-                content = f.read().lower()
-                terms = set()
+    Заново токенизируются только новые и изменённые страницы, количества
+    остальных берутся из сохранённой матрицы. IDF и веса пересчитываются
+    целиком - это несколько матричных операций.
+    """
+    tokenizer = tokenizer or Tokenizer(cache_file=lemma_cache_file)
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        changes = json.load(f)
+    changed = set(changes.get('added', [])) | set(changes.get('modified', []))
+    removed = changed | set(changes.get('deleted', []))
 
-                if 'lemmas' in folder:
-                    # Для лемм собираем все формы
-                    for line in content.split('\n'):
-                        if ':' in line:
-                            lemma = line.split(':')[0]
-                            terms.add(lemma)
-                else:
-                    # Для токенов просто строки
-                    terms.update(line.strip() for line in content.split('\n') if line.strip())
+    old = load_tfidf(tfidf_file)
+    tokens, lemmas = Vocabulary(old['tokens'].tolist()), Vocabulary(old['lemmas'].tolist())
+    lemma_of_token = old['lemma_of_token'].tolist()
 
-                for term in terms:
-                    doc_freq[term] += 1
+    keep = np.array([doc_id not in removed for doc_id in old['doc_ids'].tolist()], dtype=bool)
+    kept_ids = old['doc_ids'][keep].tolist()
+    new_ids = sorted(changed)
+    new_counts = count_terms(new_ids, TermCounter(tokenizer, tokens, lemmas, lemma_of_token))
 
-    return doc_freq
+    # Словарь мог вырасти - дополняем старую матрицу пустыми столбцами
+    kept_counts = old['token_counts'][keep]
+    kept_counts = sparse.csr_matrix((kept_counts.data, kept_counts.indices, kept_counts.indptr),
+                                    shape=(kept_counts.shape[0], len(tokens)))
 
+    doc_ids = kept_ids + new_ids
+    order = np.argsort(doc_ids, kind='stable')
+    token_counts = sparse.csr_matrix(sparse.vstack([kept_counts, new_counts]))[order]
+    save_tfidf(tfidf_file, np.asarray(doc_ids)[order], tokens.terms, lemmas.terms, lemma_of_token, token_counts)
+    tokenizer.save_cache()
 
-def calculate_tf_idf():
-    """Основная функция для расчета TF-IDF"""
-    # Подсчитываем частоту документов для токенов и лемм
-    total_docs = 100
-    token_doc_freq = count_doc_frequencies(tokens_folder)
-    lemma_doc_freq = count_doc_frequencies(lemmas_folder)
-
-    # Вычисляем IDF для всех токенов и лемм
-    token_idf = {term: math.log(total_docs / (freq + 1)) for term, freq in token_doc_freq.items()}
-    lemma_idf = {lemma: math.log(total_docs / (freq + 1)) for lemma, freq in lemma_doc_freq.items()}
-
-    # Обрабатываем каждый документ
-    for doc_file in os.listdir(docs_folder):
-        if doc_file.endswith('.txt'):
-            doc_id = doc_file.replace('page_', '').replace('.txt', '')
-
-            # Чтение токенов документа
-            token_file = os.path.join(tokens_folder, f'page_{doc_id}_tokens.txt')
-            if os.path.exists(token_file):
-                with open(token_file, 'r', encoding='utf-8') as f_tokens:
-                    words = [line.strip() for line in f_tokens if line.strip()]
-                    total_terms = len(words)
-            else:
-                words = []
-                total_terms = 0
-
-            # Обработка токенов
-            token_file = os.path.join(tokens_folder, f'page_{doc_id}_tokens.txt')
-            if os.path.exists(token_file):
-                tokens = load_tokens(token_file)
-                token_counts = defaultdict(int)
-                for word in words:
-                    if word in tokens:
-                        token_counts[word] += 1
-
-                # Запись TF-IDF для токенов
-                with open(os.path.join(output_tokens, f'tfidf_tokens_{doc_id}.txt'), 'w', encoding='utf-8') as f_out:
-                    for token in tokens:
-                        tf = token_counts.get(token, 0) / total_terms
-                        idf = token_idf.get(token, 0)
-                        tfidf = tf * idf
-                        f_out.write(f"{token} {idf} {tfidf}\n")
-
-            # Обработка лемм
-            lemma_file = os.path.join(lemmas_folder, f'page_{doc_id}_lemmas.txt')
-            if os.path.exists(lemma_file):
-                lemmas = load_lemmas(lemma_file)  # Загружаем леммы и их формы
-                lemma_counts = defaultdict(int)
-
-                # Считаем, сколько раз формы леммы встречаются среди токенов
-                for lemma, forms in lemmas.items():
-                    for form in forms:
-                        # Количество вхождений формы леммы в список токенов
-                        lemma_counts[lemma] += words.count(form)
-
-                # Запись TF-IDF для лемм
-                with open(os.path.join(output_lemmas, f'tfidf_lemmas_{doc_id}.txt'), 'w', encoding='utf-8') as f_out:
-                    for lemma in lemmas:
-                        tf = lemma_counts.get(lemma, 0) / total_terms
-                        idf = lemma_idf.get(lemma, 0)
-                        tfidf = tf * idf
-                        f_out.write(f"{lemma} {idf} {tfidf}\n")
+    print(f"TF-IDF обновлён: пересчитано документов {len(new_ids)}, "
+          f"удалено {len(removed - changed)}, всего {len(doc_ids)}")
 
 
 if __name__ == "__main__":
-    calculate_tf_idf()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Расчёт TF-IDF")
+    parser.add_argument('--update', nargs='?', const=os.path.join(project_root, 'task1', 'changed_docs.json'),
+                        metavar='MANIFEST', help="пересчитать только изменённые документы")
+    args = parser.parse_args()
+
+    if args.update:
+        update_tf_idf(args.update)
+    else:
+        calculate_tf_idf()
@@ -1,125 +1,232 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, abort, g, jsonify, render_template, request
+import io
 import os
-import math
-import json
-from collections import defaultdict, Counter
-import numpy as np
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+
+from main import SNAPSHOT_PATH, load_engine, source_files
+from result_cache import DictClient, LocalBackend, ResultCache, SharedBackend
+from serving import Overloaded, SearchExecutor, SearchTimeout
+from metrics import COUNT_BUCKETS, CallbackMetric, Histogram, registry, tracer
 
 app = Flask(__name__)
 
-# Конфигурация (оставляем ваш существующий код)
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DOCS_DIR = os.path.join(PROJECT_ROOT, 'task1', 'выкачка')
-INDEX_FILE = os.path.join(PROJECT_ROOT, 'task1', 'index.txt')
-TFIDF_TOKENS_DIR = os.path.join(PROJECT_ROOT, 'task4', 'tfidf_tokens')
-INVERTED_INDEX_PATH = os.path.join(PROJECT_ROOT, 'task3', 'inverted_index.json')
-TOTAL_DOCS = 100
-
-
-def load_links():
-    links = {}
-    with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split(':', 1)
-            if len(parts) == 2:
-                doc_id = parts[0].strip()
-                url = parts[1].strip()
-                try:
-                    links[int(doc_id)] = url
-                except ValueError:
-                    continue
-    return links
-
-
-def load_inverted_index():
-    with open(INVERTED_INDEX_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def load_tfidf_vectors():
-    vectors = {}
-    for filename in os.listdir(TFIDF_TOKENS_DIR):
-        if filename.endswith('.txt'):
-            doc_id = int(filename.split('_')[-1].split('.')[0])
-            vectors[doc_id] = {}
-            with open(os.path.join(TFIDF_TOKENS_DIR, filename), 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) == 3:
-                        term, idf, tfidf = parts
-                        vectors[doc_id][term] = float(tfidf)
-    return vectors
-
-
-class VectorSearchEngine:
-    def __init__(self):
-        self.links = load_links()
-        self.inverted_index = load_inverted_index()
-        self.tfidf_vectors = load_tfidf_vectors()
-        self.all_terms = self._get_all_terms()
-
-    def _get_all_terms(self):
-        terms = set()
-        for doc_id in self.tfidf_vectors:
-            terms.update(self.tfidf_vectors[doc_id].keys())
-        return sorted(terms)
-
-    def query_to_vector(self, query_text):
-        tokens = [w.lower() for w in query_text.split() if w.isalpha()]
-        lemmas = tokens  # Замените на вашу лемматизацию
-
-        lemma_counts = Counter(lemmas)
-        query_vector = np.zeros(len(self.all_terms))
-
-        for i, term in enumerate(self.all_terms):
-            if term in lemma_counts:
-                tf = lemma_counts[term] / len(lemmas)
-                # Получаем документы для термина из JSON (уже в правильном формате)
-                doc_count = len(self.inverted_index.get(term, []))
-                idf = math.log(TOTAL_DOCS / (doc_count + 1e-10))
-                query_vector[i] = tf * idf
-        return query_vector
-
-    def search(self, query_text, top_n=10):
-        query_vec = self.query_to_vector(query_text)
-        scores = []
-
-        for doc_id in range(1, TOTAL_DOCS + 1):
-            doc_vec = np.zeros(len(self.all_terms))
-            for i, term in enumerate(self.all_terms):
-                doc_vec[i] = self.tfidf_vectors.get(doc_id, {}).get(term, 0)
-
-            norm_query = np.linalg.norm(query_vec)
-            norm_doc = np.linalg.norm(doc_vec)
-            if norm_query > 0 and norm_doc > 0:
-                similarity = np.dot(query_vec, doc_vec) / (norm_query * norm_doc)
-            else:
-                similarity = 0
-            scores.append((doc_id, similarity))
-
-        scores = [(doc_id, score) for doc_id, score in scores if score > 0]
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_n]
-
-    def print_results(self, scores):
-        if not scores:
-            print("Ничего не найдено")
-            return
-
-        print(f"Топ 10 документов, найдено: {len(scores)}")
-        for doc_id, score in scores:
-            print(f"Документ {doc_id} (сходство: {score:.4f}): {self.links.get(doc_id, 'ссылка не найдена')}")
-
-
-# Создаем экземпляр поисковика при запуске приложения
-search_engine = VectorSearchEngine()
+# Как часто проверять, не пересобраны ли снимок или индексы, с
+RELOAD_CHECK_INTERVAL = 5.0
+# Сколько запросов можно прислать в /search/batch за раз
+MAX_BATCH_SIZE = 10000
+# Сколько раз /debug/profile может повторить запрос
+MAX_PROFILE_REPEAT = 1000
+# Замеры этапов и /metrics (SEARCH_METRICS=0 - выключить), профилировщик - только по явному SEARCH_PROFILING=1
+METRICS_ENABLED = os.environ.get('SEARCH_METRICS', '1') != '0'
+PROFILING_ENABLED = os.environ.get('SEARCH_PROFILING', '0') == '1'
+# Пространство ранжирования, если в запросе нет space: tokens или lemmas (пусто - как в main.py)
+SEARCH_SPACE = os.environ.get('SEARCH_SPACE') or None
+
+
+def data_stamp():
+    """Времена изменения снимка и исходных файлов: меняются при любой пересборке"""
+    paths = [SNAPSHOT_PATH] + source_files()
+    return tuple(os.path.getmtime(path) for path in paths if os.path.exists(path))
+
+
+def make_result_cache():
+    """Кэш результатов: общий через redis, если задан SEARCH_CACHE_REDIS_URL, иначе в памяти процесса.
+    SEARCH_CACHE_REDIS_URL=memory:// - путь SharedBackend без сервера redis (DictClient)"""
+    ttl = float(os.environ.get('SEARCH_CACHE_TTL', 300))
+    redis_url = os.environ.get('SEARCH_CACHE_REDIS_URL')
+    if redis_url == 'memory://':
+        return ResultCache(SharedBackend(DictClient()), ttl=ttl)
+    if redis_url:
+        import redis
+
+        return ResultCache(SharedBackend(redis.Redis.from_url(redis_url)), ttl=ttl)
+    return ResultCache(LocalBackend(int(os.environ.get('SEARCH_CACHE_SIZE', 1024))), ttl=ttl)
+
+
+def make_executor():
+    """Пул поиска: SEARCH_THREADS потоков, не больше SEARCH_MAX_IN_FLIGHT запросов в работе,
+    SEARCH_TIMEOUT секунд на запрос"""
+    workers = int(os.environ.get('SEARCH_THREADS', 0)) or None
+    max_in_flight = int(os.environ.get('SEARCH_MAX_IN_FLIGHT', 0)) or None
+    return SearchExecutor(workers, max_in_flight, timeout=float(os.environ.get('SEARCH_TIMEOUT', 5)))
+
+
+# Создаем экземпляр поисковика при запуске приложения (из снимка, если он собран)
+search_engine = load_engine()
+loaded_stamp = data_stamp()
+last_check = time.monotonic()
+reload_lock = threading.Lock()
+result_cache = make_result_cache()
+executor = make_executor()
+
+tracer.enabled = METRICS_ENABLED
+request_seconds = registry.register(Histogram(
+    'search_request_seconds', 'Время обработки запроса, с', labels=('route',)))
+result_counts = registry.register(Histogram(
+    'search_results', 'Число найденных документов на запрос', buckets=COUNT_BUCKETS, labels=('route',)))
+registry.register(CallbackMetric(
+    'search_result_cache_requests_total', 'Обращения к кэшу результатов', 'counter',
+    lambda: {('hit',): result_cache.hits, ('miss',): result_cache.misses}, labels=('result',)))
+registry.register(CallbackMetric(
+    'search_query_analyzer_requests_total', 'Обращения к кэшу разбора слов запроса', 'counter',
+    lambda: {('hit',): search_engine.analyzer.hits, ('miss',): search_engine.analyzer.misses}, labels=('result',)))
+registry.register(CallbackMetric(
+    'search_executor_in_flight', 'Поисков в работе', 'gauge', lambda: {(): executor.stats()['in_flight']}))
+registry.register(CallbackMetric(
+    'search_executor_rejected_total', 'Отказы из-за перегрузки (503) и таймауты (504)', 'counter',
+    lambda: {('overloaded',): executor.rejected, ('timeout',): executor.timeouts}, labels=('reason',)))
+
+
+def current_engine():
+    """Поисковик; после пересборки данных на диске он перезагружается,
+    а вместе с его версией сбрасывается и кэш результатов"""
+    global search_engine, loaded_stamp, last_check
+    if time.monotonic() - last_check < RELOAD_CHECK_INTERVAL:
+        return search_engine
+    with reload_lock:
+        if time.monotonic() - last_check >= RELOAD_CHECK_INTERVAL:
+            stamp = data_stamp()
+            if stamp != loaded_stamp:
+                search_engine = load_engine()
+                loaded_stamp = stamp
+            last_check = time.monotonic()
+    return search_engine
+
+
+def request_space(value, search_engine):
+    """Пространство ранжирования из параметра space запроса или None, если такого нет"""
+    space = value or SEARCH_SPACE or search_engine.default_space
+    return space if isinstance(space, str) and space in search_engine.spaces else None
+
+
+def space_error(search_engine):
+    return jsonify({'error': f"space должен быть одним из: {', '.join(sorted(search_engine.spaces))}"}), 400
+
+
+def warm_up():
+    """Загружает лемматизатор и прогоняет пробный запрос - вызывается в мастере gunicorn
+    до форка, чтобы воркеры получили всё уже готовым"""
+    search_engine.analyzer.tokenizer.morph
+    search_engine.search('поиск')
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    if METRICS_ENABLED and request.endpoint is not None and 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start, request.endpoint)
+    return response
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    return jsonify({'error': 'сервер перегружен, повторите запрос позже'}), 503, {'Retry-After': '1'}
+
+
+@app.errorhandler(SearchTimeout)
+def search_timeout(error):
+    return jsonify({'error': f'поиск не уложился в {executor.timeout:g} с'}), 504
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/serving/stats')
+def serving_stats():
+    return jsonify(executor.stats())
+
+
+@app.route('/metrics')
+def metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profile')
+def profile():
+    """Профиль cProfile одного поиска: /debug/profile?q=...&mode=matrix&space=tokens&repeat=100&sort=cumulative.
+
+    Поиск идёт мимо кэша результатов и пула, прямо в потоке обработчика
+    (cProfile видит только свой поток). Доступно только при SEARCH_PROFILING=1.
+    """
+    if not PROFILING_ENABLED:
+        abort(404)
+    query = request.args.get('q', '')
+    mode = request.args.get('mode', 'matrix')
+    sort = request.args.get('sort', 'cumulative')
+    repeat = min(max(request.args.get('repeat', 1, type=int), 1), MAX_PROFILE_REPEAT)
+    if mode not in ('matrix', 'maxscore', 'lsa'):
+        return jsonify({'error': 'mode должен быть matrix, maxscore или lsa'}), 400
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        return jsonify({'error': 'sort должен быть cumulative, tottime или ncalls'}), 400
+
+    search_engine = current_engine()
+    space = request_space(request.args.get('space'), search_engine)
+    if space is None:
+        return space_error(search_engine)
+    if mode == 'lsa' and search_engine.lsa is None:
+        return jsonify({'error': 'индекс LSA не построен (main.py build-snapshot --lsa-dims)'}), 400
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(repeat):
+        search_engine.search(query, top_n=10, mode=mode, space=space)
+    profiler.disable()
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(50)
+    return Response(out.getvalue(), mimetype='text/plain')
+
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """{"queries": [...], "top_n": 10, "space": "lemmas"} -> {"results": [[{"id", "score", "url"}, ...], ...]}"""
+    payload = request.get_json(silent=True) or {}
+    queries = payload.get('queries')
+    top_n = payload.get('top_n', 10)
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({'error': 'queries должен быть списком строк'}), 400
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 0:
+        return jsonify({'error': 'top_n должен быть неотрицательным целым'}), 400
+    if len(queries) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'не больше {MAX_BATCH_SIZE} запросов за раз'}), 413
+
+    search_engine = current_engine()
+    space = request_space(payload.get('space'), search_engine)
+    if space is None:
+        return space_error(search_engine)
+    results = executor.run(search_engine.search_batch, queries, top_n=top_n, space=space)
+    if METRICS_ENABLED:
+        for found in results:
+            result_counts.observe(len(found), 'search_batch')
+    return jsonify({'results': [
+        [{'id': doc_id, 'score': score, 'url': search_engine.links.get(doc_id)} for doc_id, score in found]
+        for found in results
+    ]})
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         query = request.form['query']
-        results = search_engine.search(query, top_n=10)
+        search_engine = current_engine()
+        space = request_space(request.form.get('space'), search_engine)
+        if space is None:
+            abort(400)
+        # Сам поиск идёт в пуле: обработчик ждёт его не дольше таймаута
+        results = executor.run(result_cache.search, search_engine, query, top_n=10, space=space)
+        if METRICS_ENABLED:
+            result_counts.observe(len(results), 'index')
 
         # Форматируем результаты для вывода в HTML
         formatted_results = []
@@ -130,15 +237,23 @@ def index():
                 'url': search_engine.links.get(doc_id, 'ссылка не найдена')
             })
 
-        return render_template('results.html',
-                               query=query,
-                               results=formatted_results,
-                               found=len(formatted_results))
+        with tracer.span('render'):
+            return render_template('results.html',
+                                   query=query,
+                                   results=formatted_results,
+                                   found=len(formatted_results))
 
     return render_template('index.html')
 
 
 if __name__ == '__main__':
+    # Для продакшена: gunicorn -c gunicorn.conf.py (см. task5/gunicorn.conf.py)
+    parser = argparse.ArgumentParser(description="Веб-интерфейс поиска (сервер разработки Flask)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--debug', action='store_true', help="отладчик и перезапуск при изменении кода")
+    args = parser.parse_args()
+
     # Создаем папку для шаблонов, если ее нет
     os.makedirs(os.path.join(app.root_path, 'templates'), exist_ok=True)
 
@@ -205,4 +320,4 @@ if __name__ == '__main__':
 </body>
 </html>''')
 
-    app.run(debug=True)
+    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
@@ -0,0 +1,33 @@
+# Запуск в продакшене: cd task5 && gunicorn -c gunicorn.conf.py
+#
+# Приложение (и снимок поисковика) загружается один раз в мастере до форка:
+# снимок открыт через mmap, поэтому все воркеры делят одни и те же страницы
+# памяти. Поиск внутри воркера идёт в пуле потоков (см. serving.py), запросы
+# сверх SEARCH_MAX_IN_FLIGHT сразу получают 503, а дольше SEARCH_TIMEOUT - 504.
+import os
+import multiprocessing
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'demo:app'
+preload_app = True
+
+bind = os.environ.get('SEARCH_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('SEARCH_WORKERS', multiprocessing.cpu_count()))
+# gthread: соединения обслуживают потоки, медленный клиент не занимает весь воркер
+worker_class = 'gthread'
+threads = int(os.environ.get('SEARCH_CONNECTION_THREADS', 8))
+# Очередь соединений, ещё не принятых воркерами
+backlog = int(os.environ.get('SEARCH_BACKLOG', 256))
+# Воркер, который не отвечает мастеру дольше timeout секунд, перезапускается
+timeout = 30
+graceful_timeout = 10
+keepalive = 5
+
+# Процессов уже по числу ядер, поэтому потоков поиска в каждом немного
+os.environ.setdefault('SEARCH_THREADS', '2')
+
+
+def when_ready(server):
+    import demo
+
+    demo.warm_up()
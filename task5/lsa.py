@@ -0,0 +1,142 @@
+import numpy as np
+
+# Латентно-семантический индекс (LSA): усечённое SVD матрицы документ-термин.
+# Документ - плотный вектор float32 из dims чисел, запрос проецируется в то же
+# пространство, и оценки всех документов - одно умножение матрицы на вектор.
+# Документы находятся и без общих с запросом слов, если их слова встречаются
+# в похожих контекстах.
+LSA_DIMS = 200
+# Сколько ближайших списков IVF просматривает запрос
+LSA_PROBES = 8
+
+
+def randomized_svd(matrix, dims, oversamples=10, n_iter=4, seed=0):
+    """Приближённое усечённое SVD разреженной матрицы (рандомизированный метод Halko и др.).
+
+    Базис строк ищется по произведению матрицы на случайную гауссову матрицу
+    с n_iter степенными итерациями, затем точное SVD маленькой проекции.
+    Возвращает (u, s, vt) с dims компонентами.
+    """
+    rng = np.random.default_rng(seed)
+    width = min(dims + oversamples, min(matrix.shape))
+    basis = matrix @ rng.standard_normal((matrix.shape[1], width))
+    for _ in range(n_iter):
+        basis, _ = np.linalg.qr(basis)
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+        basis = matrix @ basis
+    basis, _ = np.linalg.qr(basis)
+
+    # Проекция матрицы на найденный базис: width x n_terms
+    projected = np.asarray((matrix.T @ basis).T)
+    u, s, vt = np.linalg.svd(projected, full_matrices=False)
+    return (basis @ u)[:, :dims], s[:dims], vt[:dims]
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    return vectors / norms[:, None]
+
+
+def spherical_kmeans(vectors, n_lists, n_iter=10, seed=0):
+    """k-средних по косинусу для нормированных векторов -> (центроиды, номер списка каждого вектора)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        # Пустой список оставляет старый центроид
+        nonempty = np.bincount(assignment, minlength=n_lists) > 0
+        centroids[nonempty] = normalize_rows(sums[nonempty])
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class LsaIndex:
+    """Векторы LSA: term_vectors (термин x dims) для проекции запроса и
+    нормированные doc_vectors (документ x dims), всё в float32.
+
+    С IVF (lists > 0) документы сгруппированы по ближайшему центроиду и лежат
+    в doc_vectors подряд по спискам: список i - строки list_indptr[i]:list_indptr[i + 1],
+    list_rows - номер строки матрицы документ-термин для каждой из них. Запрос
+    просматривает только n_probe списков с ближайшими центроидами.
+    """
+
+    n_probe = LSA_PROBES
+
+    def __init__(self, space, term_vectors, doc_vectors, centroids=None, list_indptr=None, list_rows=None):
+        self.space = space
+        self.term_vectors = term_vectors
+        self.doc_vectors = doc_vectors
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_rows = list_rows
+
+    @property
+    def dims(self):
+        return self.doc_vectors.shape[1]
+
+    @property
+    def n_lists(self):
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @classmethod
+    def build(cls, space, doc_matrix, dims=LSA_DIMS, n_lists=0, seed=0):
+        """Индекс по матрице документ-термин пространства space (строки уже нормированы)"""
+        dims = min(dims, min(doc_matrix.shape))
+        u, s, vt = randomized_svd(doc_matrix, dims, seed=seed)
+        term_vectors = np.ascontiguousarray(vt.T, dtype=np.float32)
+        doc_vectors = normalize_rows(u * s).astype(np.float32)
+        if not n_lists:
+            return cls(space, term_vectors, doc_vectors)
+
+        n_lists = min(n_lists, len(doc_vectors))
+        centroids, assignment = spherical_kmeans(doc_vectors, n_lists, seed=seed)
+        list_rows = np.argsort(assignment, kind='stable')
+        list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+        list_indptr[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+        return cls(space, term_vectors, np.ascontiguousarray(doc_vectors[list_rows]),
+                   centroids.astype(np.float32), list_indptr, list_rows)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Индекс из массивов lsa_* снимка поисковика или None, если его туда не записали"""
+        if 'lsa_doc_vectors' not in snapshot:
+            return None
+        if 'lsa_centroids' in snapshot:
+            ivf = (snapshot['lsa_centroids'], snapshot['lsa_list_indptr'], snapshot['lsa_list_rows'])
+        else:
+            ivf = ()
+        return cls(snapshot.meta['lsa_space'], snapshot['lsa_term_vectors'], snapshot['lsa_doc_vectors'], *ivf)
+
+    def snapshot_arrays(self, term_order):
+        """Массивы для снимка; строки term_vectors переставляются в порядке term_order"""
+        arrays = {'lsa_term_vectors': self.term_vectors[term_order], 'lsa_doc_vectors': self.doc_vectors}
+        if self.centroids is not None:
+            arrays.update(lsa_centroids=self.centroids, lsa_list_indptr=self.list_indptr,
+                          lsa_list_rows=self.list_rows)
+        return arrays
+
+    def project(self, term_ids, weights):
+        """Нормированный вектор запроса в пространстве LSA"""
+        query = np.asarray(weights, dtype=np.float32) @ self.term_vectors[term_ids]
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def search(self, query, top_n, n_probe=None):
+        """(строки матрицы документ-термин, оценки) top_n документов с положительным косинусом"""
+        if self.centroids is None:
+            rows, scores = None, self.doc_vectors @ query
+        else:
+            n_probe = min(n_probe or self.n_probe, self.n_lists)
+            probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            # Списки лежат подряд, так что каждый - одно умножение непрерывного куска на вектор
+            bounds = [(self.list_indptr[i], self.list_indptr[i + 1]) for i in np.sort(probes)]
+            rows = np.concatenate([self.list_rows[start:end] for start, end in bounds])
+            scores = np.concatenate([self.doc_vectors[start:end] @ query for start, end in bounds])
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_n:
+            candidates = np.sort(candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]])
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return (candidates if rows is None else rows[candidates]), scores[candidates]
@@ -1,15 +1,42 @@
 import os
-import math
-import json
+import sys
+import time
+import heapq
+import argparse
+from bisect import bisect_left
 from collections import defaultdict, Counter
 import numpy as np
+from scipy import sparse
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DOCS_DIR = os.path.join(PROJECT_ROOT, 'task1', 'выкачка')
 INDEX_FILE = os.path.join(PROJECT_ROOT, 'task1', 'index.txt')
 TFIDF_TOKENS_DIR = os.path.join(PROJECT_ROOT, 'task4', 'tfidf_tokens')
+TFIDF_LEMMAS_DIR = os.path.join(PROJECT_ROOT, 'task4', 'tfidf_lemmas')
+TFIDF_MATRIX_PATH = os.path.join(PROJECT_ROOT, 'task4', 'tfidf.npz')
 INVERTED_INDEX_PATH = os.path.join(PROJECT_ROOT, 'task3', 'inverted_index.json')
-TOTAL_DOCS = 100
+INVERTED_INDEX_BIN_PATH = os.path.join(PROJECT_ROOT, 'task3', 'inverted_index.bin')
+POSITIONS_PATH = os.path.join(PROJECT_ROOT, 'task3', 'inverted_index.pos')
+SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, 'task5', 'engine.snapshot')
+LEMMA_CACHE_PATH = os.path.join(PROJECT_ROOT, 'task2', 'lemma_cache.txt')
+# До какого размера (запросы x документы) матрица оценок пачки разворачивается в плотную
+DENSE_SCORES_LIMIT = 1 << 22
+# Близость слов запроса: сколько лучших документов пересчитывается и с каким весом
+PROXIMITY_CANDIDATES = 50
+PROXIMITY_WEIGHT = 0.5
+# Пространства ранжирования: столбцы матрицы - формы слов (токены) или леммы;
+# значение - префикс массивов пространства в снимке
+SPACES = {'tokens': '', 'lemmas': 'lemma_'}
+DEFAULT_SPACE = 'tokens'
+
+sys.path.append(os.path.join(PROJECT_ROOT, 'task3'))
+
+from binary_index import load_inverted_index as load_index_file
+from positional_index import PositionalIndex, min_window
+from snapshot import Snapshot, SortedTerms, StringTable, LinkTable, pack_strings, write_snapshot
+from query_analyzer import QueryAnalyzer, Tokenizer, group_forms
+from lsa import LSA_DIMS, LsaIndex
+from metrics import tracer
 
 
 def load_links():
@@ -28,74 +55,655 @@ def load_links():
 
 
 def load_inverted_index():
-    with open(INVERTED_INDEX_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return load_index_file(INVERTED_INDEX_BIN_PATH, INVERTED_INDEX_PATH)
 
 
-def load_tfidf_vectors():
+def load_tfidf_vectors(folder=TFIDF_TOKENS_DIR, idfs=None):
+    """Текстовые файлы task4 -> {doc_id: {term: tfidf}}; idfs, если передан, дополняется IDF терминов"""
     vectors = {}
-    for filename in os.listdir(TFIDF_TOKENS_DIR):
+    for filename in os.listdir(folder):
         if filename.endswith('.txt'):
             doc_id = int(filename.split('_')[-1].split('.')[0])
             vectors[doc_id] = {}
-            with open(os.path.join(TFIDF_TOKENS_DIR, filename), 'r', encoding='utf-8') as f:
+            with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
                 for line in f:
                     parts = line.strip().split()
                     if len(parts) == 3:
                         term, idf, tfidf = parts
                         vectors[doc_id][term] = float(tfidf)
+                        if idfs is not None:
+                            idfs[term] = float(idf)
     return vectors
 
 
+def vectors_to_matrix(vectors):
+    """Словари {doc_id: {term: tfidf}} -> (doc_ids, термины, матрица CSR документ-термин)"""
+    all_terms = sorted(set().union(*vectors.values())) if vectors else []
+    term_ids = {term: i for i, term in enumerate(all_terms)}
+    doc_ids = np.array(sorted(vectors), dtype=np.int64)
+
+    rows, cols, data = [], [], []
+    for row, doc_id in enumerate(doc_ids):
+        for term, weight in vectors[int(doc_id)].items():
+            if weight != 0:
+                rows.append(row)
+                cols.append(term_ids[term])
+                data.append(weight)
+
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(doc_ids), len(all_terms)), dtype=np.float64)
+    return doc_ids, all_terms, matrix
+
+
+def lemmatize_terms(all_terms):
+    """Леммы терминов словаря (через кэш лемм task2) -> (леммы, номер леммы каждого термина)"""
+    tokenizer = Tokenizer(stop_words=(), cache_file=LEMMA_CACHE_PATH)
+    lemma_ids = {}
+    term_lemma = [lemma_ids.setdefault(tokenizer.lemmatize(term), len(lemma_ids)) for term in all_terms]
+    return list(lemma_ids), np.array(term_lemma, dtype=np.int64)
+
+
+def load_tfidf_matrix():
+    """Матрица TF-IDF токенов из task4/tfidf.npz, а если её нет - из старых текстовых файлов.
+
+    Возвращает (doc_ids, термины, матрица, леммы, номер леммы каждого термина).
+    """
+    if os.path.exists(TFIDF_MATRIX_PATH):
+        with np.load(TFIDF_MATRIX_PATH) as arrays:
+            doc_ids = arrays['doc_ids'].astype(np.int64)
+            all_terms = arrays['tokens'].tolist()
+            matrix = sparse.csr_matrix(
+                (arrays['token_tfidf_data'], arrays['token_tfidf_indices'], arrays['token_tfidf_indptr']),
+                shape=(len(doc_ids), len(all_terms)), dtype=np.float64)
+            lemmas = arrays['lemmas'].tolist()
+            term_lemma = arrays['lemma_of_token'].astype(np.int64)
+        return doc_ids, all_terms, matrix, lemmas, term_lemma
+    doc_ids, all_terms, matrix = vectors_to_matrix(load_tfidf_vectors())
+    return (doc_ids, all_terms, matrix) + lemmatize_terms(all_terms)
+
+
+def load_lemma_tfidf(doc_ids, lemmas):
+    """Матрица TF-IDF лемм task4 (столбец - номер леммы в lemmas) и IDF лемм, или None, если её нет.
+
+    Строки - документы в порядке doc_ids. Леммы из старых текстовых файлов,
+    которых нет в lemmas, дописываются в конец списка.
+    """
+    if os.path.exists(TFIDF_MATRIX_PATH):
+        with np.load(TFIDF_MATRIX_PATH) as arrays:
+            matrix = sparse.csr_matrix(
+                (arrays['lemma_tfidf_data'], arrays['lemma_tfidf_indices'], arrays['lemma_tfidf_indptr']),
+                shape=(len(doc_ids), len(lemmas)), dtype=np.float64)
+            return matrix, arrays['lemma_idf'].astype(np.float64)
+    if not os.path.isdir(TFIDF_LEMMAS_DIR):
+        return None
+
+    idfs = {}
+    vectors = load_tfidf_vectors(TFIDF_LEMMAS_DIR, idfs)
+    lemma_ids = {lemma: i for i, lemma in enumerate(lemmas)}
+    for lemma in sorted(idfs):
+        if lemma not in lemma_ids:
+            lemma_ids[lemma] = len(lemmas)
+            lemmas.append(lemma)
+    rows, cols, data = [], [], []
+    for row, doc_id in enumerate(doc_ids.tolist()):
+        for lemma, weight in vectors.get(doc_id, {}).items():
+            if weight != 0:
+                rows.append(row)
+                cols.append(lemma_ids[lemma])
+                data.append(weight)
+    idf = np.zeros(len(lemmas))
+    for lemma, value in idfs.items():
+        idf[lemma_ids[lemma]] = value
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(doc_ids), len(lemmas)), dtype=np.float64)
+    return matrix, idf
+
+
+def load_positions():
+    """Позиционный индекс task3 (build_index.py --positions) или None"""
+    return PositionalIndex(POSITIONS_PATH) if os.path.exists(POSITIONS_PATH) else None
+
+
+def source_files():
+    """Файлы, из которых собирается поисковик"""
+    sources = [INDEX_FILE, INVERTED_INDEX_BIN_PATH, INVERTED_INDEX_PATH, TFIDF_MATRIX_PATH, POSITIONS_PATH,
+               os.path.join(PROJECT_ROOT, 'task3', 'segments', 'segments.json')]
+    return [source for source in sources if os.path.exists(source)]
+
+
+def source_version():
+    """Версия данных поисковика - время последнего изменения исходных файлов"""
+    return f"files-{max((os.path.getmtime(source) for source in source_files()), default=0)}"
+
+
+class ScoringSpace:
+    """Пространство, в котором считается косинус: столбцы - токены или леммы.
+
+    doc_matrix - матрица документ-термин с нормированными строками,
+    term_matrix - она же транспонированная (списки словопозиций),
+    idf - вес термина в векторе запроса.
+    """
+
+    def __init__(self, term_idf, doc_norms, doc_matrix, term_matrix, term_max_weight, term_min_weight):
+        self.term_idf = term_idf
+        self.doc_norms = doc_norms
+        self.doc_matrix = doc_matrix
+        self.term_matrix = term_matrix
+        self.term_max_weight = term_max_weight
+        self.term_min_weight = term_min_weight
+
+    @property
+    def n_terms(self):
+        return self.doc_matrix.shape[1]
+
+    @classmethod
+    def from_matrix(cls, matrix, term_idf):
+        """Готовим матрицу документ-термин один раз при запуске"""
+        # Нормы документов считаем заранее и сразу нормируем строки,
+        # тогда косинус - это просто скалярное произведение
+        doc_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inv_norms = np.zeros_like(doc_norms)
+        nonzero = doc_norms > 0
+        inv_norms[nonzero] = 1.0 / doc_norms[nonzero]
+        return cls.from_normalized(sparse.csr_matrix(sparse.diags(inv_norms) @ matrix), doc_norms, term_idf)
+
+    @classmethod
+    def from_normalized(cls, doc_matrix, doc_norms, term_idf):
+        """Пространство по матрице с уже нормированными строками"""
+        # Транспонированная матрица (термин -> документы) - это по сути списки
+        # словопозиций, из неё берём только строки терминов запроса
+        term_matrix = doc_matrix.T.tocsr()
+        term_matrix.sort_indices()
+
+        # Верхние оценки вклада термина: максимальный и минимальный вес
+        # в его списке (минимальный нужен для отрицательных IDF)
+        row_lengths = np.diff(term_matrix.indptr)
+        term_max_weight = np.zeros(doc_matrix.shape[1])
+        term_min_weight = np.zeros(doc_matrix.shape[1])
+        nonempty = row_lengths > 0
+        starts = term_matrix.indptr[:-1][nonempty]
+        term_max_weight[nonempty] = np.maximum.reduceat(term_matrix.data, starts)
+        term_min_weight[nonempty] = np.minimum.reduceat(term_matrix.data, starts)
+        return cls(np.asarray(term_idf, dtype=np.float64), doc_norms, doc_matrix, term_matrix,
+                   term_max_weight, term_min_weight)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, prefix, n_docs):
+        """Пространство из массивов снимка с префиксом prefix (матрицы смотрят прямо в файл)"""
+        n_terms = len(snapshot[prefix + 'term_idf'])
+        doc_matrix = sparse.csr_matrix(
+            (snapshot[prefix + 'doc_data'], snapshot[prefix + 'doc_indices'], snapshot[prefix + 'doc_indptr']),
+            shape=(n_docs, n_terms), copy=False)
+        term_matrix = sparse.csr_matrix(
+            (snapshot[prefix + 'term_data'], snapshot[prefix + 'term_indices'], snapshot[prefix + 'term_indptr']),
+            shape=(n_terms, n_docs), copy=False)
+        return cls(snapshot[prefix + 'term_idf'], snapshot[prefix + 'doc_norms'], doc_matrix, term_matrix,
+                   snapshot[prefix + 'term_max_weight'], snapshot[prefix + 'term_min_weight'])
+
+    def select(self, rows):
+        """Пространство только из документов-строк rows (IDF остаётся общим)"""
+        return ScoringSpace.from_normalized(sparse.csr_matrix(self.doc_matrix[rows]),
+                                            np.asarray(self.doc_norms)[rows], self.term_idf)
+
+    def snapshot_arrays(self, prefix, order):
+        """Массивы для снимка; термины переставляются в порядке order"""
+        doc_matrix = sparse.csr_matrix(self.doc_matrix[:, order])
+        doc_matrix.sort_indices()
+        term_matrix = sparse.csr_matrix(self.term_matrix[order])
+        term_matrix.sort_indices()
+        arrays = {
+            prefix + 'term_idf': np.asarray(self.term_idf, dtype=np.float64)[order],
+            prefix + 'doc_norms': np.asarray(self.doc_norms, dtype=np.float64),
+            prefix + 'term_max_weight': np.asarray(self.term_max_weight)[order],
+            prefix + 'term_min_weight': np.asarray(self.term_min_weight)[order],
+        }
+        for name, matrix in (('doc', doc_matrix), ('term', term_matrix)):
+            arrays[f'{prefix}{name}_data'] = matrix.data
+            arrays[f'{prefix}{name}_indices'] = matrix.indices
+            arrays[f'{prefix}{name}_indptr'] = matrix.indptr
+        return arrays
+
+
 class VectorSearchEngine:
+    # Вес близости слов запроса в документе (0 - не учитывать); работает, если есть позиционный индекс
+    proximity_weight = PROXIMITY_WEIGHT
+    proximity_candidates = PROXIMITY_CANDIDATES
+    # Пространство ранжирования по умолчанию (см. SPACES), search(space=...) выбирает его на запрос
+    default_space = DEFAULT_SPACE
+
     def __init__(self):
         self.links = load_links()
         self.inverted_index = load_inverted_index()
-        self.tfidf_vectors = load_tfidf_vectors()
-        self.all_terms = self._get_all_terms()
-
-    def _get_all_terms(self):
-        terms = set()
-        for doc_id in self.tfidf_vectors:
-            terms.update(self.tfidf_vectors[doc_id].keys())
-        return sorted(terms)
-
-    def query_to_vector(self, query_text):
-        tokens = [w.lower() for w in query_text.split() if w.isalpha()]
-        lemmas = tokens  # Замените на вашу лемматизацию
-
-        lemma_counts = Counter(lemmas)
-        query_vector = np.zeros(len(self.all_terms))
-
-        for i, term in enumerate(self.all_terms):
-            if term in lemma_counts:
-                tf = lemma_counts[term] / len(lemmas)
-                # Получаем документы для термина из JSON (уже в правильном формате)
-                doc_count = len(self.inverted_index.get(term, []))
-                idf = math.log(TOTAL_DOCS / (doc_count + 1e-10))
-                query_vector[i] = tf * idf
-        return query_vector
-
-    def search(self, query_text, top_n=10):
-        query_vec = self.query_to_vector(query_text)
-        scores = []
-
-        for doc_id in range(1, TOTAL_DOCS + 1):
-            doc_vec = np.zeros(len(self.all_terms))
-            for i, term in enumerate(self.all_terms):
-                doc_vec[i] = self.tfidf_vectors.get(doc_id, {}).get(term, 0)
-
-            norm_query = np.linalg.norm(query_vec)
-            norm_doc = np.linalg.norm(doc_vec)
-            if norm_query > 0 and norm_doc > 0:
-                similarity = np.dot(query_vec, doc_vec) / (norm_query * norm_doc)
+        self.positions = load_positions()
+        # Индекс LSA строится долго, поэтому его берут из снимка (build-snapshot --lsa-dims) или build_lsa()
+        self.lsa = None
+        self.doc_ids, self.all_terms, matrix, self.lemmas, self.term_lemma = load_tfidf_matrix()
+        lemma_tfidf = load_lemma_tfidf(self.doc_ids, self.lemmas)
+        self.term_ids = {term: i for i, term in enumerate(self.all_terms)}
+        self.lemma_ids = {lemma: i for i, lemma in enumerate(self.lemmas)}
+        self.form_indptr, self.form_ids = group_forms(self.term_lemma, len(self.lemmas))
+        # IDF всех терминов считаем один раз, число документов берём из индекса task3
+        doc_freq = np.array([self._index_doc_freq(term) for term in self.all_terms], dtype=np.float64)
+        term_idf = np.log(len(self.doc_ids) / (doc_freq + 1e-10))
+        self.snapshot = None
+        self.version = source_version()
+        self.spaces = {'tokens': ScoringSpace.from_matrix(matrix, term_idf)}
+        if lemma_tfidf is not None:
+            self.spaces['lemmas'] = ScoringSpace.from_matrix(*lemma_tfidf)
+        self._build_analyzer()
+
+    @classmethod
+    def from_snapshot(cls, path=SNAPSHOT_PATH):
+        """Поисковик из готового снимка (см. build_snapshot): файл отображается
+        в память, массивы и матрицы смотрят прямо в него, ничего не пересчитывается"""
+        snapshot = Snapshot(path)
+        engine = cls.__new__(cls)
+        engine.snapshot = snapshot
+        engine.version = f"snapshot-{snapshot.meta['created']}"
+        engine.links = LinkTable(snapshot['link_doc_ids'], StringTable(snapshot['link_urls'],
+                                                                       snapshot['link_url_offsets']))
+        engine.inverted_index = None
+        engine.positions = load_positions()
+        engine.doc_ids = snapshot['doc_ids']
+        engine.all_terms = SortedTerms(snapshot['terms'], snapshot['term_offsets'])
+        engine.term_ids = engine.all_terms
+        engine.lemmas = SortedTerms(snapshot['lemmas'], snapshot['lemma_offsets'])
+        engine.lemma_ids = engine.lemmas
+        engine.term_lemma = snapshot['term_lemma']
+        engine.form_indptr = snapshot['form_indptr']
+        engine.form_ids = snapshot['form_ids']
+        # Страницы пространства, по которому не ищут, в память не читаются
+        engine.spaces = {space: ScoringSpace.from_snapshot(snapshot, prefix, len(engine.doc_ids))
+                         for space, prefix in SPACES.items() if prefix + 'term_idf' in snapshot}
+        engine.lsa = LsaIndex.from_snapshot(snapshot)
+        engine._build_analyzer()
+        return engine
+
+    def build_snapshot(self, path=SNAPSHOT_PATH):
+        """Сохраняет всё, что нужно для поиска, в один файл снимка.
+
+        Термины и леммы сортируются по utf-8 байтам (номер в снимке - позиция),
+        вместо индекса task3 сохраняется только IDF каждого термина.
+        """
+        order = sorted(range(len(self.all_terms)), key=lambda i: self.all_terms[i].encode('utf-8'))
+        terms = [self.all_terms[i] for i in order]
+        order = np.array(order, dtype=np.int64)
+
+        lemma_order = sorted(range(len(self.lemmas)), key=lambda i: self.lemmas[i].encode('utf-8'))
+        lemmas = [self.lemmas[i] for i in lemma_order]
+        lemma_position = np.empty(len(lemma_order), dtype=np.int64)
+        lemma_position[lemma_order] = np.arange(len(lemma_order))
+        term_lemma = lemma_position[np.asarray(self.term_lemma, dtype=np.int64)[order]]
+        form_indptr, form_ids = group_forms(term_lemma, len(lemmas))
+        lemma_order = np.array(lemma_order, dtype=np.int64)
+
+        terms_blob, term_offsets = pack_strings(terms)
+        lemmas_blob, lemma_offsets = pack_strings(lemmas)
+        link_doc_ids = np.array(sorted(self.links), dtype=np.int64)
+        urls_blob, url_offsets = pack_strings([self.links[int(doc_id)] for doc_id in link_doc_ids])
+
+        arrays = {
+            'doc_ids': np.asarray(self.doc_ids, dtype=np.int64),
+            'terms': terms_blob,
+            'term_offsets': term_offsets,
+            'lemmas': lemmas_blob,
+            'lemma_offsets': lemma_offsets,
+            'term_lemma': term_lemma,
+            'form_indptr': form_indptr,
+            'form_ids': form_ids,
+            'link_doc_ids': link_doc_ids,
+            'link_urls': urls_blob,
+            'link_url_offsets': url_offsets,
+        }
+        arrays.update(self.spaces['tokens'].snapshot_arrays(SPACES['tokens'], order))
+        if 'lemmas' in self.spaces:
+            arrays.update(self.spaces['lemmas'].snapshot_arrays(SPACES['lemmas'], lemma_order))
+        meta = {'n_docs': len(self.doc_ids), 'n_terms': len(terms), 'n_lemmas': len(lemmas),
+                'spaces': sorted(self.spaces)}
+        if self.lsa is not None:
+            arrays.update(self.lsa.snapshot_arrays(order if self.lsa.space == 'tokens' else lemma_order))
+            meta.update(lsa_space=self.lsa.space, lsa_dims=self.lsa.dims, lsa_lists=self.lsa.n_lists)
+        write_snapshot(path, arrays, meta=meta)
+
+    def build_lsa(self, dims=LSA_DIMS, n_lists=0, space=None):
+        """Строит индекс LSA по матрице пространства space (для search(mode='lsa')).
+
+        n_lists > 0 - ещё и списки IVF: запрос будет сравниваться не со всеми
+        документами, а только с документами ближайших списков.
+        """
+        space = self._space(space)
+        self.lsa = LsaIndex.build(space, self.spaces[space].doc_matrix, dims, n_lists)
+
+    def select_docs(self, rows):
+        """Поисковик только по документам-строкам rows - шард (см. shards.py).
+
+        Словари, леммы и IDF остаются общими, поэтому оценка документа в шарде
+        та же, что и во всём поисковике. Индекс LSA в шард не переносится.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        shard = VectorSearchEngine.__new__(VectorSearchEngine)
+        shard.__dict__.update(self.__dict__)
+        shard.doc_ids = np.asarray(self.doc_ids)[rows]
+        shard.links = {int(doc_id): self.links[int(doc_id)] for doc_id in shard.doc_ids if int(doc_id) in self.links}
+        shard.spaces = {space: scoring.select(rows) for space, scoring in self.spaces.items()}
+        shard.lsa = None
+        return shard
+
+    def _index_doc_freq(self, term):
+        doc_freq = getattr(self.inverted_index, 'doc_freq', None)
+        if doc_freq is not None:
+            return doc_freq(term)
+        return len(self.inverted_index.get(term, []))
+
+    def _build_analyzer(self):
+        self.analyzer = QueryAnalyzer(self.term_ids, self.term_lemma, self.lemmas, self.lemma_ids,
+                                      self.form_indptr, self.form_ids)
+
+    def _space(self, space):
+        """Имя пространства ранжирования (None - default_space), проверенное на наличие"""
+        space = space or self.default_space
+        if space not in SPACES:
+            raise ValueError(f"Неизвестное пространство ранжирования: {space}")
+        if space not in self.spaces:
+            raise ValueError(f"Пространство {space} не загружено: нет TF-IDF лемм task4")
+        return space
+
+    def query_terms(self, query_text):
+        """Леммы слов запроса (с повторами)"""
+        return [lemma for lemma, forms in self.analyzer.analyze(query_text)]
+
+    def query_key(self, query_text):
+        """Нормализованный запрос: запросы с одинаковым ключом дают одинаковый результат"""
+        return tuple(sorted(Counter(self.query_terms(query_text)).items()))
+
+    def query_lemmas(self, query_text):
+        """[(лемма, номера её форм, tf леммы)] по разным леммам запроса"""
+        analyzed = self.analyzer.analyze(query_text)
+        counts = Counter(lemma for lemma, forms in analyzed)
+        forms_of = dict(analyzed)
+        return [(lemma, forms_of[lemma], count / len(analyzed)) for lemma, count in counts.items()]
+
+    def query_to_vector(self, query_text, space=None):
+        """Возвращает номера терминов запроса и их веса TF-IDF.
+
+        В пространстве токенов лемма запроса даёт вес tf * idf каждой своей
+        форме из словаря, в пространстве лемм - только самой лемме.
+        """
+        space = self._space(space)
+        term_ids, tfs = self._query_tfs(self.query_lemmas(query_text), space)
+        return term_ids, tfs * self.spaces[space].term_idf[term_ids]
+
+    def _query_tfs(self, lemma_forms, space):
+        """Номера терминов пространства space для лемм запроса и их tf"""
+        if space == 'lemmas':
+            found = [(self.lemma_ids.get(lemma), tf) for lemma, forms, tf in lemma_forms]
+            found = [(lemma_id, tf) for lemma_id, tf in found if lemma_id is not None]
+            return (np.array([lemma_id for lemma_id, tf in found], dtype=np.int64),
+                    np.array([tf for lemma_id, tf in found], dtype=np.float64))
+        if not lemma_forms:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        term_ids = np.concatenate([forms for lemma, forms, tf in lemma_forms])
+        tfs = np.concatenate([np.full(len(forms), tf) for lemma, forms, tf in lemma_forms])
+        return term_ids.astype(np.int64), tfs
+
+    def search(self, query_text, top_n=10, mode='matrix', proximity=None, space=None):
+        """Поиск по запросу.
+
+        mode='matrix' - умножение матрицы на вектор запроса,
+        mode='maxscore' - обход списков словопозиций с отсечением MaxScore,
+        mode='lsa' - косинус в пространстве LSA (см. build_lsa), приближённый поиск:
+        находит и документы без слов запроса; space при этом - пространство индекса LSA.
+        proximity - вес близости слов запроса (None - self.proximity_weight, 0 - не учитывать):
+        лучшие proximity_candidates документов пересчитываются по позиционному индексу.
+        space - пространство ранжирования: 'tokens' (формы слов) или 'lemmas'
+        (TF-IDF лемм task4, словарь в несколько раз меньше); None - default_space.
+        """
+        if mode == 'lsa':
+            if self.lsa is None:
+                raise ValueError("Индекс LSA не построен: python main.py build-snapshot --lsa-dims 200")
+            space = self.lsa.space
+        space = self._space(space)
+        scoring = self.spaces[space]
+        with tracer.span('analyze'):
+            lemma_forms = self.query_lemmas(query_text)
+        with tracer.span('vectorize'):
+            term_ids, tfs = self._query_tfs(lemma_forms, space)
+            weights = tfs * scoring.term_idf[term_ids]
+            norm_query = np.linalg.norm(weights)
+        if norm_query == 0 or top_n <= 0:
+            return []
+
+        proximity = self._proximity(proximity, lemma_forms)
+        k = max(top_n, self.proximity_candidates) if proximity else top_n
+        if mode == 'maxscore':
+            with tracer.span('maxscore'):
+                results = self._search_maxscore(scoring, term_ids, weights / norm_query, k)
+        elif mode == 'matrix':
+            results = self._search_matrix(scoring, term_ids, weights, norm_query, k)
+        elif mode == 'lsa':
+            with tracer.span('lsa'):
+                rows, scores = self.lsa.search(self.lsa.project(term_ids, weights), k)
+                results = [(int(doc_id), float(score)) for doc_id, score in zip(self.doc_ids[rows], scores)]
+        else:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+
+        if proximity:
+            with tracer.span('proximity'):
+                results = self._proximity_rescore(results, lemma_forms, proximity)
+        return results[:top_n]
+
+    def _search_matrix(self, scoring, term_ids, weights, norm_query, top_n):
+        # Одно умножение разреженной матрицы на вектор, причём
+        # участвуют только строки терминов из запроса
+        with tracer.span('score'):
+            scores = scoring.term_matrix[term_ids].T.dot(weights) / norm_query
+
+        with tracer.span('sort'):
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_n:
+                top = np.argpartition(-scores[candidates], top_n - 1)[:top_n]
+                candidates = np.sort(candidates[top])
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(int(self.doc_ids[i]), float(scores[i])) for i in candidates]
+
+    def _proximity(self, proximity, lemma_forms):
+        """Вес близости для запроса, 0 - пересчёт не нужен"""
+        if proximity is None:
+            proximity = self.proximity_weight
+        if self.positions is None or len(lemma_forms) < 2:
+            return 0.0
+        return proximity
+
+    def _proximity_rescore(self, results, lemma_forms, weight):
+        """Пересчёт оценок кандидатов с учётом близости слов запроса.
+
+        Для каждого документа ищется наименьшее окно, в котором встречаются все
+        найденные в нём леммы запроса (любой формой). Оценка умножается на
+        1 + weight * близость, где близость = (число лемм - 1) / окно с поправкой
+        на долю найденных лемм: 1, если все слова запроса стоят подряд.
+        """
+        docs = sorted(doc_id for doc_id, _ in results)
+        lemma_positions = []
+        for _, forms, _ in lemma_forms:
+            positions = defaultdict(list)
+            for term_id in forms.tolist():
+                cursor = self.positions.cursor(self.all_terms[term_id])
+                if cursor is None:
+                    continue
+                for doc_id in docs:
+                    if cursor.advance(doc_id) is None:
+                        break
+                    if cursor.doc == doc_id:
+                        positions[doc_id].extend(cursor.positions())
+            lemma_positions.append(positions)
+
+        rescored = []
+        for doc_id, score in results:
+            lists = [sorted(positions[doc_id]) for positions in lemma_positions if doc_id in positions]
+            if len(lists) > 1:
+                window = max(min_window(lists), len(lists) - 1)
+                closeness = (len(lists) - 1) / window * len(lists) / len(lemma_positions)
+                score *= 1 + weight * closeness
+            rescored.append((doc_id, score))
+        rescored.sort(key=lambda item: -item[1])
+        return rescored
+
+    def search_batch(self, queries, top_n=10, chunk_size=1024, proximity=None, space=None):
+        """Поиск по списку запросов, результат - список результатов search() в том же порядке.
+
+        Запросы собираются в разреженную матрицу (строка - нормированный вектор
+        запроса) и умножаются на матрицу термин-документ одним произведением;
+        top_n выбирается по каждой строке. chunk_size ограничивает, сколько
+        запросов обрабатывается за одно умножение (и сколько памяти оно займёт).
+        Близость слов и пространство ранжирования - так же, как в search().
+        """
+        space = self._space(space)
+        use_proximity = (proximity if proximity is not None else self.proximity_weight) and self.positions is not None
+        k = max(top_n, self.proximity_candidates) if use_proximity and top_n > 0 else top_n
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            results.extend(self._search_chunk(queries[start:start + chunk_size], k, space))
+
+        if use_proximity:
+            with tracer.span('batch_proximity'):
+                for i, query_text in enumerate(queries):
+                    lemma_forms = self.query_lemmas(query_text)
+                    weight = self._proximity(proximity, lemma_forms)
+                    if weight:
+                        results[i] = self._proximity_rescore(results[i], lemma_forms, weight)
+                    results[i] = results[i][:top_n]
+        return results
+
+    def _query_matrix(self, queries, space):
+        """Разреженная матрица запросов: строка - нормированный вектор TF-IDF запроса"""
+        scoring = self.spaces[space]
+        rows, cols, tfs = [], [], []
+        for row, query_text in enumerate(queries):
+            term_ids, term_tfs = self._query_tfs(self.query_lemmas(query_text), space)
+            rows.append(np.full(len(term_ids), row, dtype=np.int64))
+            cols.append(term_ids)
+            tfs.append(term_tfs)
+
+        if rows:
+            rows, cols, tfs = np.concatenate(rows), np.concatenate(cols).astype(np.int64), np.concatenate(tfs)
+        else:
+            rows, cols, tfs = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                               np.zeros(0, dtype=np.float64))
+        query_matrix = sparse.csr_matrix((tfs * scoring.term_idf[cols], (rows, cols)),
+                                         shape=(len(queries), scoring.n_terms))
+        norms = np.sqrt(np.asarray(query_matrix.multiply(query_matrix).sum(axis=1)).ravel())
+        inv_norms = np.zeros_like(norms)
+        inv_norms[norms > 0] = 1.0 / norms[norms > 0]
+        return sparse.csr_matrix(sparse.diags(inv_norms) @ query_matrix)
+
+    def _search_chunk(self, queries, top_n, space):
+        if top_n <= 0:
+            return [[] for _ in queries]
+        with tracer.span('batch_vectorize'):
+            query_matrix = self._query_matrix(queries, space)
+        with tracer.span('batch_score'):
+            scores = sparse.csr_matrix(query_matrix @ self.spaces[space].term_matrix)
+        with tracer.span('batch_sort'):
+            return self._top_n_rows(scores, len(queries), top_n)
+
+    def _top_n_rows(self, scores, n_queries, top_n):
+        """top_n документов каждой строки матрицы оценок"""
+        if n_queries * scores.shape[1] <= DENSE_SCORES_LIMIT:
+            # Небольшую матрицу оценок выгоднее развернуть: порог top_n каждой
+            # строки находится через np.partition, и дальше сортируются только
+            # оценки не ниже порога (с равными ему - все, чтобы порядок при
+            # равенстве оценок был тем же, что у search())
+            dense = scores.toarray()
+            k = min(top_n, dense.shape[1])
+            thresholds = -np.partition(-dense, k - 1, axis=1)[:, k - 1]
+            score_rows, score_cols = np.nonzero((dense >= thresholds[:, None]) & (dense > 0))
+            values = dense[score_rows, score_cols]
+        else:
+            score_rows = np.repeat(np.arange(n_queries), np.diff(scores.indptr))
+            positive = scores.data > 0
+            score_rows, score_cols, values = score_rows[positive], scores.indices[positive], scores.data[positive]
+
+        # top_n по всем строкам сразу: одна сортировка кандидатов по
+        # (запрос, -оценка, документ), затем из каждой строки берём первые top_n
+        order = np.lexsort((score_cols, -values, score_rows))
+        score_rows, score_cols, values = score_rows[order], score_cols[order], values[order]
+
+        row_starts = np.searchsorted(score_rows, np.arange(n_queries))
+        keep = np.arange(len(score_rows)) - row_starts[score_rows] < top_n
+        score_rows, score_cols, values = score_rows[keep], score_cols[keep], values[keep]
+
+        bounds = np.searchsorted(score_rows, np.arange(n_queries + 1)).tolist()
+        doc_ids = self.doc_ids[score_cols].tolist()
+        values = values.tolist()
+        return [list(zip(doc_ids[start:end], values[start:end])) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _search_maxscore(self, scoring, term_ids, weights, top_n):
+        """Обход списков словопозиций терминов запроса (MaxScore).
+
+        Термины сортируются по верхней оценке вклада. Термины, сумма оценок
+        которых не дотягивает до порога top_n, становятся "необязательными":
+        по ним документы не перебираются, а только досчитываются, и только
+        если у документа ещё есть шанс попасть в top_n.
+        """
+        matrix = scoring.term_matrix
+        postings = []
+        for term_id, weight in zip(term_ids, weights):
+            start, end = matrix.indptr[term_id], matrix.indptr[term_id + 1]
+            if start == end:
+                continue
+            if weight >= 0:
+                bound = weight * scoring.term_max_weight[term_id]
             else:
-                similarity = 0
-            scores.append((doc_id, similarity))
+                bound = weight * scoring.term_min_weight[term_id]
+            postings.append((max(bound, 0.0), matrix.indices[start:end], matrix.data[start:end], weight))
+        postings.sort(key=lambda p: p[0])
+
+        # prefix_bounds[i] - сумма верхних оценок терминов 0..i
+        prefix_bounds = list(np.cumsum([p[0] for p in postings]))
+        positions = [0] * len(postings)
+        heap = []  # (score, -row), минимальный элемент - текущий порог
+        threshold = 0.0
+        first_essential = 0
+
+        while True:
+            while first_essential < len(postings) and prefix_bounds[first_essential] <= threshold:
+                first_essential += 1
+            if first_essential == len(postings):
+                break
 
-        scores = [(doc_id, score) for doc_id, score in scores if score > 0]
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_n]
+            # Следующий документ - минимальный среди обязательных терминов
+            row = None
+            for i in range(first_essential, len(postings)):
+                ids = postings[i][1]
+                if positions[i] < len(ids) and (row is None or ids[positions[i]] < row):
+                    row = ids[positions[i]]
+            if row is None:
+                break
+
+            score = 0.0
+            for i in range(first_essential, len(postings)):
+                ids = postings[i][1]
+                if positions[i] < len(ids) and ids[positions[i]] == row:
+                    score += postings[i][3] * postings[i][2][positions[i]]
+                    positions[i] += 1
+
+            # Досчитываем необязательные термины, пока документ может пройти порог
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix_bounds[i] <= threshold:
+                    break
+                ids = postings[i][1]
+                positions[i] = bisect_left(ids, row, positions[i])
+                if positions[i] < len(ids) and ids[positions[i]] == row:
+                    score += postings[i][3] * postings[i][2][positions[i]]
+
+            if score > threshold:
+                if len(heap) < top_n:
+                    heapq.heappush(heap, (score, -row))
+                else:
+                    heapq.heapreplace(heap, (score, -row))
+                if len(heap) == top_n:
+                    threshold = heap[0][0]
+
+        results = sorted(heap, key=lambda item: (-item[0], -item[1]))
+        return [(int(self.doc_ids[-neg_row]), float(score)) for score, neg_row in results]
 
     def print_results(self, scores):
         if not scores:
@@ -107,8 +715,50 @@ class VectorSearchEngine:
             print(f"Документ {doc_id} (сходство: {score:.4f}): {self.links.get(doc_id, 'ссылка не найдена')}")
 
 
+def snapshot_is_stale(snapshot_path):
+    """Снимок старше файлов, из которых он собран"""
+    snapshot_mtime = os.path.getmtime(snapshot_path)
+    return any(os.path.getmtime(source) > snapshot_mtime for source in source_files())
+
+
+def load_engine(snapshot_path=SNAPSHOT_PATH):
+    """Поисковик из снимка, если он есть и не устарел, иначе - сборка из файлов task1, task3 и task4"""
+    if snapshot_path and os.path.exists(snapshot_path):
+        if snapshot_is_stale(snapshot_path):
+            print(f"Снимок {snapshot_path} устарел, пересоберите его: python main.py build-snapshot")
+        else:
+            try:
+                return VectorSearchEngine.from_snapshot(snapshot_path)
+            except ValueError as e:
+                print(f"{e}, пересоберите снимок: python main.py build-snapshot")
+    return VectorSearchEngine()
+
+
 if __name__ == "__main__":
-    engine = VectorSearchEngine()
+    parser = argparse.ArgumentParser(description="Векторный поиск")
+    parser.add_argument('command', nargs='?', choices=['search', 'build-snapshot'], default='search',
+                        help="build-snapshot - собрать снимок для быстрого запуска (после перестройки индексов)")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, help="файл снимка")
+    parser.add_argument('--lsa-dims', type=int, default=0,
+                        help="добавить в снимок индекс LSA такой размерности (100-300), 0 - без LSA")
+    parser.add_argument('--lsa-lists', type=int, default=0,
+                        help="списков IVF для индекса LSA (порядка корня из числа документов), 0 - без IVF")
+    parser.add_argument('--lsa-space', choices=sorted(SPACES), default=DEFAULT_SPACE,
+                        help="по какой матрице строить LSA")
+    args = parser.parse_args()
+
+    if args.command == 'build-snapshot':
+        engine = VectorSearchEngine()
+        if args.lsa_dims > 0:
+            start = time.perf_counter()
+            engine.build_lsa(args.lsa_dims, args.lsa_lists, args.lsa_space)
+            print(f"Индекс LSA: {engine.lsa.dims} измерений, списков IVF {engine.lsa.n_lists}, "
+                  f"{time.perf_counter() - start:.2f} с")
+        engine.build_snapshot(args.snapshot)
+        print(f"Снимок сохранён в файл: {args.snapshot}")
+        sys.exit()
+
+    engine = load_engine(args.snapshot)
 
     print("=== Векторная поисковая система ===")
     while True:
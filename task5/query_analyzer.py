@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'task2'))
+
+from tokenizer import Tokenizer
+
+NO_FORMS = np.zeros(0, dtype=np.int64)
+
+
+def group_forms(term_lemma, n_lemmas):
+    """Номер леммы каждого термина -> (границы, номера терминов): формы леммы i -
+    это form_ids[form_indptr[i]:form_indptr[i + 1]]"""
+    term_lemma = np.asarray(term_lemma, dtype=np.int64)
+    form_ids = np.argsort(term_lemma, kind='stable')
+    form_indptr = np.zeros(n_lemmas + 1, dtype=np.int64)
+    form_indptr[1:] = np.cumsum(np.bincount(term_lemma, minlength=n_lemmas))
+    return form_indptr, form_ids
+
+
+class QueryAnalyzer:
+    """Разбор запроса тем же токенизатором и лемматизатором, что и документы в task2.
+
+    Слово запроса приводится к лемме и заменяется всеми формами этой леммы,
+    которые есть в словаре, поэтому запрос находит документы с любой формой слова.
+    Лемма слова из словаря берётся готовой (её посчитали при индексации),
+    pymorphy2 нужен только для незнакомых слов. Результат разбора слова
+    хранится в LRU на cache_size слов.
+    """
+
+    def __init__(self, term_ids, term_lemma, lemmas, lemma_ids, form_indptr, form_ids,
+                 tokenizer=None, cache_size=10000):
+        self.term_ids = term_ids
+        self.term_lemma = term_lemma
+        self.lemmas = lemmas
+        self.lemma_ids = lemma_ids
+        self.form_indptr = form_indptr
+        self.form_ids = form_ids
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer(cache_size=cache_size)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def analyze_token(self, token):
+        """Токен -> (лемма, номера терминов-форм этой леммы)"""
+        with self._lock:
+            result = self.cache.get(token)
+            if result is not None:
+                self.hits += 1
+                self.cache.move_to_end(token)
+                return result
+
+            self.misses += 1
+            term_id = self.term_ids.get(token)
+            if term_id is not None:
+                lemma_id = int(self.term_lemma[term_id])
+                lemma = self.lemmas[lemma_id]
+            else:
+                lemma = self.tokenizer.lemmatize(token)
+                lemma_id = self.lemma_ids.get(lemma)
+
+            forms = NO_FORMS
+            if lemma_id is not None:
+                forms = self.form_ids[self.form_indptr[lemma_id]:self.form_indptr[lemma_id + 1]]
+            result = (lemma, forms)
+            self.cache[token] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return result
+
+    def analyze(self, query_text):
+        """[(лемма, номера форм)] для каждого слова запроса по порядку (с повторами)"""
+        return [self.analyze_token(token) for token in self.tokenizer.iter_tokens(query_text)]
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.cache),
+                'hit_rate': self.hits / total if total else 0.0}
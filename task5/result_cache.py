@@ -0,0 +1,194 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LocalBackend:
+    """Кэш в памяти процесса: LRU на max_size записей, у каждой записи свой срок жизни"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedBackend:
+    """Общий для всех воркеров кэш поверх клиента с интерфейсом redis
+    (get(key) и set(key, value, ex=секунды)), например redis.Redis.
+
+    Значения хранятся в JSON. Размер и вытеснение - на стороне сервера
+    (для redis - maxmemory и политика allkeys-lru).
+    """
+
+    def __init__(self, client, prefix='search:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def clear(self):
+        # Записи старых версий сами уходят по TTL, ключи новых версий с ними не совпадают
+        pass
+
+
+class DictClient:
+    """Заменитель redis-клиента в памяти процесса - для тестов и локального запуска SharedBackend"""
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+
+class ResultCache:
+    """Кэш результатов поиска.
+
+    Ключ - версия данных поисковика, нормализованные термины запроса,
+    top_n и режим поиска. Версия входит в ключ, поэтому после пересборки
+    снимка или индекса старые записи просто перестают находиться, а
+    локальный кэш при смене версии ещё и очищается целиком.
+    """
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(version, terms, top_n, mode, space):
+        raw = json.dumps([version, terms, top_n, mode, space], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _check_version(self, version):
+        if self._version != version:
+            if self._version is not None:
+                self.backend.clear()
+            self._version = version
+
+    def search(self, engine, query_text, top_n=10, mode='matrix', space=None):
+        """engine.search() через кэш"""
+        space = space or engine.default_space
+        key = self.make_key(engine.version, engine.query_key(query_text), top_n, mode, space)
+        with self._lock:
+            self._check_version(engine.version)
+
+        results = self.backend.get(key)
+        if results is not None:
+            with self._lock:
+                self.hits += 1
+            return [(doc_id, score) for doc_id, score in results]
+
+        with self._lock:
+            self.misses += 1
+        results = engine.search(query_text, top_n=top_n, mode=mode, space=space)
+        self.backend.set(key, [[doc_id, score] for doc_id, score in results], self.ttl)
+        return results
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self.backend) if hasattr(self.backend, '__len__') else None,
+            'version': self._version,
+        }
+
+
+class _CountingEngine:
+    """Минимальный поисковик для check(): считает вызовы search()"""
+
+    default_space = 'tokens'
+
+    def __init__(self):
+        self.version = 'v1'
+        self.calls = 0
+
+    def query_key(self, query_text):
+        return sorted(query_text.lower().split())
+
+    def search(self, query_text, top_n=10, mode='matrix', space=None):
+        self.calls += 1
+        return [(1, 0.5), (2, 0.25)][:top_n]
+
+
+def check():
+    """Проверка ResultCache поверх SharedBackend(DictClient()): попадания и промахи,
+    сброс при смене версии данных и истечение TTL"""
+    engine = _CountingEngine()
+    cache = ResultCache(SharedBackend(DictClient()), ttl=1)
+
+    assert cache.search(engine, 'собака кошка') == [(1, 0.5), (2, 0.25)]
+    assert cache.search(engine, 'Кошка собака') == [(1, 0.5), (2, 0.25)]
+    assert (cache.hits, cache.misses, engine.calls) == (1, 1, 1)
+
+    # Новая версия данных - новый ключ, старая запись больше не находится
+    engine.version = 'v2'
+    cache.search(engine, 'собака кошка')
+    assert (cache.hits, cache.misses, engine.calls) == (1, 2, 2)
+    assert cache.stats()['version'] == 'v2'
+
+    # После TTL запись уходит и запрос снова идёт в поисковик
+    time.sleep(1.1)
+    cache.search(engine, 'собака кошка')
+    assert (cache.hits, cache.misses, engine.calls) == (1, 3, 3)
+    cache.search(engine, 'собака кошка')
+    assert (cache.hits, cache.misses, engine.calls) == (2, 3, 3)
+    print("ResultCache + SharedBackend(DictClient()): OK", cache.stats())
+
+
+if __name__ == '__main__':
+    check()
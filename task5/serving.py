@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class Overloaded(Exception):
+    """Все места для запросов заняты - запрос не принят"""
+
+
+class SearchTimeout(Exception):
+    """Поиск не уложился в отведённое время"""
+
+
+class SearchExecutor:
+    """Пул потоков для поиска с ограничением числа запросов в работе и таймаутом.
+
+    Обработчик запроса только ставит поиск в пул и ждёт результат не дольше
+    timeout секунд. Место (max_in_flight) освобождается, когда поиск реально
+    закончился, а не когда клиенту ответили таймаутом, поэтому зависшие
+    поиски тоже учитываются, и при перегрузке новые запросы сразу получают
+    отказ, а не копятся в очереди.
+
+    Потоки не переживают fork, поэтому пул создаётся заново в каждом процессе
+    (при первом запросе): приложение можно загрузить в мастере gunicorn до форка.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, timeout=5.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self.timeout = timeout
+        self.rejected = 0
+        self.timeouts = 0
+        self._pid = None
+        self._pool = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        # Вызывается под self._lock
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='search')
+            self._in_flight = 0
+            self._pid = os.getpid()
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self._ensure_pool()
+            if self._in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise Overloaded()
+            self._in_flight += 1
+            pool = self._pool
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) в пуле; Overloaded, если мест нет, SearchTimeout по таймауту"""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Если поиск ещё не начался, он и не начнётся
+            future.cancel()
+            self.timeouts += 1
+            raise SearchTimeout()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self._in_flight if self._pid == os.getpid() else 0,
+            'timeout': self.timeout,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,227 @@
+"""Шардированный поиск: документы делятся на N шардов, у каждого свой процесс.
+
+    python shards.py build --shards 4
+    python shards.py search [--boolean]
+
+Шард - это снимок поисковика (main.py) и бинарный индекс task3 только по его
+документам. Словари и IDF у всех шардов общие (посчитаны по всей коллекции),
+поэтому оценка документа в шарде та же, что и без шардирования, и слияние
+top_n шардов даёт тот же top_n, что и один поисковик.
+
+Координатор (ShardedSearchEngine) запускает по процессу на шард, рассылает
+запрос всем шардам через multiprocessing.Pipe и сливает их ответы кучей.
+"""
+import os
+import json
+import time
+import heapq
+import argparse
+import threading
+import multiprocessing
+from itertools import islice
+
+import numpy as np
+
+from main import PROJECT_ROOT, VectorSearchEngine, load_links, source_files
+from binary_index import BinaryInvertedIndex, write_binary_index
+from query_compiler import BooleanSearcher
+from tokenizer import load_stop_words
+
+SHARDS_DIR = os.path.join(PROJECT_ROOT, 'task5', 'shards')
+MANIFEST_NAME = 'shards.json'
+
+
+def shard_of(doc_id, n_shards):
+    return doc_id % n_shards
+
+
+def build_shards(n_shards, folder=SHARDS_DIR):
+    """Делит документы поисковика и индекс task3 на n_shards шардов в папке folder"""
+    engine = VectorSearchEngine()
+    os.makedirs(folder, exist_ok=True)
+
+    index_doc_ids = getattr(engine.inverted_index, 'doc_ids', None)
+    if index_doc_ids is None:
+        index_doc_ids = set()
+        for postings in engine.inverted_index.values():
+            index_doc_ids.update(postings)
+    shard_postings = [{} for _ in range(n_shards)]
+    for term, postings in engine.inverted_index.items():
+        for doc_id in postings:
+            shard_postings[shard_of(doc_id, n_shards)].setdefault(term, []).append(doc_id)
+
+    shards = []
+    doc_ids = np.asarray(engine.doc_ids)
+    for shard in range(n_shards):
+        snapshot_name, index_name = f'shard_{shard}.snapshot', f'shard_{shard}.bin'
+        rows = np.flatnonzero(shard_of(doc_ids, n_shards) == shard)
+        engine.select_docs(rows).build_snapshot(os.path.join(folder, snapshot_name))
+        write_binary_index(os.path.join(folder, index_name), shard_postings[shard],
+                           [doc_id for doc_id in index_doc_ids if shard_of(doc_id, n_shards) == shard])
+        shards.append({'snapshot': snapshot_name, 'index': index_name, 'docs': len(rows)})
+        print(f"Шард {shard}: документов {len(rows)}")
+
+    manifest = {'n_shards': n_shards, 'created': time.time(), 'shards': shards}
+    tmp_path = os.path.join(folder, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(folder, MANIFEST_NAME))
+
+
+def serve_shard(snapshot_path, index_path, conn):
+    """Цикл процесса шарда: (метод, args, kwargs) -> (True, результат) или (False, ошибка); None - выход"""
+    try:
+        engine = VectorSearchEngine.from_snapshot(snapshot_path)
+        searcher = BooleanSearcher(BinaryInvertedIndex(index_path), positions=engine.positions,
+                                   stop_words=load_stop_words())
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+        return
+    methods = {'search': engine.search, 'search_batch': engine.search_batch, 'boolean_search': searcher.search}
+    conn.send((True, len(engine.doc_ids)))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        name, args, kwargs = message
+        try:
+            conn.send((True, methods[name](*args, **kwargs)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+def merge_top(results, top_n):
+    """Слияние отсортированных по убыванию оценки ответов шардов; при равных
+    оценках раньше идёт меньший номер документа - как и в одном поисковике"""
+    return list(islice(heapq.merge(*results, key=lambda item: (-item[1], item[0])), top_n))
+
+
+class ShardedSearchEngine:
+    """Координатор: search() и search_batch() как у VectorSearchEngine, плюс boolean_search().
+
+    Каждый запрос рассылается всем шардам сразу и ждёт всех. Процесс шарда
+    обрабатывает запросы по одному, поэтому канал шарда занимается под
+    блокировкой; блокировки берутся всегда в порядке номеров шардов.
+    """
+
+    print_results = VectorSearchEngine.print_results
+
+    def __init__(self, folder=SHARDS_DIR):
+        with open(os.path.join(folder, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.version = f"shards-{manifest['created']}"
+        self.links = load_links()
+        # spawn: шарды не наследуют потоки и открытые файлы координатора
+        context = multiprocessing.get_context('spawn')
+        self._shards = []
+        for shard in manifest['shards']:
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=serve_shard, daemon=True, args=(
+                os.path.join(folder, shard['snapshot']), os.path.join(folder, shard['index']), child_conn))
+            process.start()
+            child_conn.close()
+            self._shards.append((process, conn, threading.Lock()))
+        # Ждём, пока все шарды загрузятся
+        self.n_docs = sum(self._gather(range(self.n_shards)))
+
+    @property
+    def n_shards(self):
+        return len(self._shards)
+
+    def _gather(self, shards):
+        results = []
+        errors = []
+        for shard in shards:
+            try:
+                ok, result = self._shards[shard][1].recv()
+            except EOFError:
+                ok, result = False, "процесс шарда завершился"
+            if not ok:
+                errors.append(f"шард {shard}: {result}")
+            results.append(result)
+        if errors:
+            raise ValueError("; ".join(errors))
+        return results
+
+    def _scatter(self, name, *args, **kwargs):
+        locked = []
+        try:
+            for _, conn, lock in self._shards:
+                lock.acquire()
+                locked.append(lock)
+                conn.send((name, args, kwargs))
+            return self._gather(range(self.n_shards))
+        finally:
+            for lock in locked:
+                lock.release()
+
+    def search(self, query_text, top_n=10, **options):
+        return merge_top(self._scatter('search', query_text, top_n, **options), top_n)
+
+    def search_batch(self, queries, top_n=10, **options):
+        per_shard = self._scatter('search_batch', queries, top_n, **options)
+        return [merge_top(results, top_n) for results in zip(*per_shard)]
+
+    def boolean_search(self, query):
+        """Номера документов по булеву запросу (отсортированы)"""
+        return list(heapq.merge(*self._scatter('boolean_search', query)))
+
+    def close(self):
+        for process, conn, lock in self._shards:
+            with lock:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                conn.close()
+        for process, _, _ in self._shards:
+            process.join(timeout=5)
+        self._shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def shards_are_stale(folder=SHARDS_DIR):
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    return any(os.path.getmtime(source) > os.path.getmtime(manifest_path) for source in source_files())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шардированный поиск")
+    parser.add_argument('command', choices=['build', 'search'])
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help="число шардов (для build)")
+    parser.add_argument('--folder', default=SHARDS_DIR, help="папка шардов")
+    parser.add_argument('--boolean', action='store_true', help="булев поиск вместо векторного")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_shards(args.shards, args.folder)
+        print(f"Шарды сохранены в папку: {args.folder}")
+        return
+
+    if shards_are_stale(args.folder):
+        print(f"Шарды в {args.folder} устарели, пересоберите их: python shards.py build")
+    with ShardedSearchEngine(args.folder) as engine:
+        print(f"=== Поиск по {engine.n_shards} шардам, документов: {engine.n_docs} ===")
+        while True:
+            query = input("\nВведите поисковый запрос (или -1 для выхода): ").strip()
+            if query.lower() == '-1':
+                break
+            try:
+                if args.boolean:
+                    print(f"Результат поиска: {engine.boolean_search(query)}")
+                else:
+                    engine.print_results(engine.search(query))
+            except ValueError as e:
+                print(f"Ошибка при обработке запроса: {e}")
+
+
+if __name__ == '__main__':
+    main()
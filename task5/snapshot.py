@@ -0,0 +1,168 @@
+import os
+import json
+import mmap
+import time
+import struct
+
+import numpy as np
+
+# Снимок поисковика - один файл, который открывается через mmap без разбора:
+#   заголовок HEADER (магия, версия формата, длина оглавления)
+#   оглавление в JSON: метаданные и для каждого массива dtype, форма и смещение
+#   массивы подряд, каждый выровнен по 64 байта
+# Массивы читаются через np.frombuffer прямо из отображённого файла, поэтому
+# загрузка не копирует данные, а форкнутые воркеры делят одни и те же страницы памяти.
+MAGIC = b'OIPSNAP\x00'
+VERSION = 2
+HEADER = struct.Struct('<8sIQ')
+ALIGN = 64
+
+
+def pack_strings(strings):
+    """Строки -> (utf-8 байты подряд, границы строк)"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class StringTable:
+    """Список строк поверх массива байтов и массива границ (строки декодируются по запросу)"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        # memoryview индексируется намного быстрее массива numpy и тоже ничего не копирует
+        self._blob = memoryview(blob)
+        self._offsets = memoryview(offsets)
+        self._len = len(offsets) - 1
+
+    def __len__(self):
+        return self._len
+
+    def raw(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.raw(i).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class SortedTerms(StringTable):
+    """Словарь терминов, отсортированных по utf-8 байтам: номер термина - его позиция.
+
+    Поиск номера - двоичный поиск, поэтому словарь не нужно собирать в dict при загрузке.
+    """
+
+    def get(self, term, default=None):
+        key = term.encode('utf-8')
+        raw = self.raw
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if raw(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._len and raw(lo) == key:
+            return lo
+        return default
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+
+class LinkTable:
+    """Отображение doc_id -> url поверх отсортированных номеров и таблицы строк"""
+
+    def __init__(self, doc_ids, urls):
+        self.doc_ids = doc_ids
+        self.urls = urls
+
+    def get(self, doc_id, default=None):
+        i = int(np.searchsorted(self.doc_ids, doc_id))
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return self.urls[i]
+        return default
+
+    def __getitem__(self, doc_id):
+        url = self.get(doc_id)
+        if url is None:
+            raise KeyError(doc_id)
+        return url
+
+    def __contains__(self, doc_id):
+        return self.get(doc_id) is not None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __iter__(self):
+        for doc_id in self.doc_ids:
+            yield int(doc_id)
+
+    def items(self):
+        for i, doc_id in enumerate(self.doc_ids):
+            yield int(doc_id), self.urls[i]
+
+
+def write_snapshot(path, arrays, meta=None):
+    """Записывает {имя: массив} и метаданные в файл снимка (атомарно, через .tmp)"""
+    toc = {'meta': dict(meta or {}, version=VERSION, created=time.time()), 'arrays': {}}
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # Смещения зависят от длины оглавления, поэтому считаем их относительно начала данных
+    offset = 0
+    for name, array in arrays.items():
+        offset += -offset % ALIGN
+        toc['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    toc_bytes = json.dumps(toc, ensure_ascii=False).encode('utf-8')
+    data_start = HEADER.size + len(toc_bytes)
+    data_start += -data_start % ALIGN
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(toc_bytes)))
+        f.write(toc_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + toc['arrays'][name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """Открытый через mmap файл снимка: meta и массивы только для чтения"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, toc_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не снимок поисковика или неподдерживаемая версия")
+
+        toc = json.loads(self._mmap[HEADER.size:HEADER.size + toc_size].decode('utf-8'))
+        data_start = HEADER.size + toc_size
+        data_start += -data_start % ALIGN
+        self.meta = toc['meta']
+        self.arrays = {}
+        for name, info in toc['arrays'].items():
+            dtype = np.dtype(info['dtype'])
+            count = int(np.prod(info['shape'], dtype=np.int64))
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + info['offset'])
+            self.arrays[name] = array.reshape(info['shape'])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays